@@ -0,0 +1,968 @@
+import sys
+import os
+import re
+import json
+import glob
+import shutil
+import pickle
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from multiprocessing import Manager, Pool, Pipe, Process, get_context
+from threading import Thread, Lock
+from functools import partial
+from time import sleep, perf_counter, time
+
+from pytube import Stream
+from pytube.monostate import Monostate
+
+import downloader_v3
+from downloader_v3 import Downloader, Job, Options, Pipeline, AdaptiveLimit, WorkQueue
+
+# =======================================================================================================================
+
+def timed(function, *args, **kwargs):
+    start = perf_counter()
+    function(*args, **kwargs)
+    return perf_counter() - start
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+def cpu_seconds():
+    own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+def generate_audio(path, duration):
+    os.system(f'ffmpeg -y -loglevel error -f lavfi -i "sine=frequency=440:duration={duration}" -c:a aac -b:a 128k '
+              f'-movflags +faststart "{path}"')
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+def make_chapters(duration, count):
+    length = duration // count
+    return {f'Chapter {idx + 1}': (idx * length, (idx + 1) * length + 1) for idx in range(count)}
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+def peak_memory(function, *args):
+    tracemalloc.start()
+    result = function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, peak
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+def peak_rss(function, *args, processes=lambda: []):
+    def rss_kb(pid):
+        try:
+            with open(f'/proc/{pid}/status', 'r') as r:
+                for line in r:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+        return 0
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    def sample():
+        while not done:
+            peak[0] = max(peak[0], rss_kb(os.getpid()) + sum(rss_kb(pid) for pid in processes()))
+            sleep(.02)
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    peak = [0]
+    done = False
+    sampler = Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        result = function(*args)
+    finally:
+        done = True
+        sampler.join()
+
+    return result, peak[0]
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+def child_pids():
+    pids = []
+    for children in glob.glob(f'/proc/{os.getpid()}/task/*/children'):
+        try:
+            with open(children, 'r') as r:
+                pids += [int(pid) for pid in r.read().split()]
+        except OSError:
+            pass
+    return pids
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+def echo(connection):
+    while True:
+        item = connection.recv()
+        if item is None:
+            break
+        connection.send(item)
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+def pipe_round_trip(items):
+    parent, child = Pipe()
+    process = Process(target=echo, args=(child,))
+    process.start()
+
+    start = perf_counter()
+    for item in items:
+        parent.send(item)
+        parent.recv()
+    seconds = perf_counter() - start
+
+    parent.send(None)
+    process.join()
+    return seconds / len(items)
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+def revision():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+def save_results(path, name, results):
+    history = []
+    if os.path.exists(path):
+        with open(path, 'r') as r:
+            history = json.load(r)
+
+    history.append({'benchmark': name, 'revision': revision(), 'time': time(), 'results': results})
+    with open(path, 'w') as w:
+        json.dump(history, w, indent=2)
+
+# =======================================================================================================================
+
+class MediaServer:
+    def __init__(self, files, latency=0):
+        self.files = files
+        self.latency = latency
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(handler):
+                sleep(self.latency)
+                name = handler.path.strip('/').split('?')[0]
+                if name not in self.files:
+                    handler.send_error(404)
+                    return
+
+                with open(self.files[name], 'rb') as r:
+                    data = r.read()
+
+                match = re.match(r'bytes=(\d+)-(\d*)', handler.headers.get('Range', ''))
+                if match is None:
+                    start, end = 0, len(data) - 1
+                    handler.send_response(200)
+                else:
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)) if match.group(2) else len(data) - 1, len(data) - 1)
+                    handler.send_response(206)
+                    handler.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+
+                handler.send_header('Content-Length', str(end - start + 1))
+                handler.end_headers()
+                handler.wfile.write(data[start:end + 1])
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    def url(self, name):
+        return f'http://127.0.0.1:{self.server.server_port}/{name}'
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class OfflineBackend:
+    def __init__(self, server, duration, chapters=0, latency=0):
+        self.server = server
+        self.duration = duration
+        self.chapters = chapters
+        self.latency = latency
+        self.playlists = {}
+        self.originals = None
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    def __enter__(self):
+        backend = self
+
+        class FakeStream:
+            def __init__(self, video_id):
+                self.itag = 140
+                self.url = backend.server.url('source.m4a') + f'?id={video_id}'
+                self.abr = '128kbps'
+                self.resolution = None
+                self.bitrate = 130000
+                self.audio_codec = 'mp4a.40.2'
+                self.video_codec = None
+                self.includes_audio_track = True
+                self.includes_video_track = False
+                self.is_progressive = False
+                self.default_filename = f'Bench {video_id}.m4a'
+
+        class FakeYouTube:
+            def __init__(self, url, **kwargs):
+                sleep(backend.latency)
+                video_id = downloader_v3.extract.video_id(url)
+                self.title = f'Bench {video_id}'
+                self.length = backend.duration
+                self.description = backend.description()
+                self.streams = [FakeStream(video_id)]
+
+        class FakePlaylist:
+            def __init__(self, url):
+                self.playlist_id = url.split('list=')[-1]
+                self.video_urls = backend.playlists[self.playlist_id]
+                sleep(backend.latency * -(-len(self.video_urls) // 100))
+
+        self.originals = (downloader_v3.YouTube, downloader_v3.Playlist)
+        downloader_v3.YouTube, downloader_v3.Playlist = FakeYouTube, FakePlaylist
+        return self
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    def __exit__(self, *args):
+        downloader_v3.YouTube, downloader_v3.Playlist = self.originals
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    def description(self):
+        if self.chapters == 0:
+            return 'No chapters here'
+
+        length = self.duration // self.chapters
+        return '\n'.join(f'{idx * length // 60:02d}:{idx * length % 60:02d} Part {idx + 1}' for idx in range(self.chapters))
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    def playlist(self, count, name=''):
+        playlist_id = f'BENCH{name}{count}'
+        self.playlists[playlist_id] = [f'https://www.youtube.com/watch?v={idx:011d}' for idx in range(count)]
+        return f'https://www.youtube.com/playlist?list={playlist_id}'
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class StageTimer:
+    STAGES = ('fetch_streams', 'download', 'stream_convert', 'convert')
+
+    def __init__(self):
+        self.lock = Lock()
+        self.stages = {}
+        self.originals = {}
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    def __enter__(self):
+        def wrap(name, function):
+            def timed_stage(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    end = perf_counter()
+                    with self.lock:
+                        stage = self.stages.setdefault(name, {'count': 0, 'busy': 0, 'first': start, 'last': end})
+                        stage['count'] += 1
+                        stage['busy'] += end - start
+                        stage['first'] = min(stage['first'], start)
+                        stage['last'] = max(stage['last'], end)
+
+            return staticmethod(timed_stage)
+
+        for name in self.STAGES:
+            self.originals[name] = getattr(Downloader, name)
+            setattr(Downloader, name, wrap(name, self.originals[name]))
+        return self
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    def __exit__(self, *args):
+        for name, function in self.originals.items():
+            setattr(Downloader, name, staticmethod(function))
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    def report(self):
+        return {name: {'count': stage['count'], 'busy': stage['busy'], 'wall': stage['last'] - stage['first']}
+                for name, stage in self.stages.items()}
+
+# =======================================================================================================================
+
+def bench_split(duration=7200, count=40, filetype='mp3', bitrate='128k'):
+    def per_chapter(file_name, timestamp, dpath):
+        if not os.path.exists(dpath):
+            os.makedirs(dpath)
+
+        for title, stamps in timestamp.items():
+            os.system(f'ffmpeg -y -loglevel error -i "{file_name}" -b:v {bitrate} -b:a {bitrate} -ss {stamps[0]} '
+                      f'-to {stamps[1]} "{os.path.join(dpath, title + f".{filetype}")}"')
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    workspace = tempfile.mkdtemp()
+    targets = [(filetype, bitrate, '', '')]
+    try:
+        source = os.path.join(workspace, 'source.m4a')
+        generate_audio(source, duration)
+        timestamp = make_chapters(duration, count)
+
+        results = {
+            'per_chapter': timed(per_chapter, source, timestamp, os.path.join(workspace, 'per_chapter')),
+            'single_pass': timed(Downloader.split_chapters, source, timestamp, targets,
+                                 os.path.join(workspace, 'single_pass')),
+            'parallel': timed(Downloader.split_chapters, source, timestamp, targets,
+                              os.path.join(workspace, 'parallel'), os.cpu_count()),
+        }
+    finally:
+        shutil.rmtree(workspace)
+
+    print(f'\nSplitting {duration}s of audio into {count} chapters')
+    for name, seconds in results.items():
+        print(f'{name:<12} {seconds:8.2f}s  ({results["per_chapter"] / seconds:.1f}x)')
+
+    return results
+
+
+# =======================================================================================================================
+
+def bench_jobs(count=10000, ipc_count=2000):
+    def stream_record(idx):
+        return {
+            'itag': 251, 'url': f'https://rr1---sn-example.googlevideo.com/videoplayback?id={idx:011d}&itag=251&' + 'x' * 600,
+            'abr': '160kbps', 'resolution': None, 'bitrate': 150000, 'audio_codec': 'opus', 'video_codec': None,
+            'only_audio': True, 'progressive': False, 'default_filename': f'Video {idx}.webm',
+        }
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    def legacy(count):
+        packages, timestamps = [], []
+        for idx in range(count):
+            record = stream_record(idx)
+            stream = Stream({'url': record['url'], 'itag': record['itag'], 'mimeType': 'audio/webm; codecs="opus"',
+                             'is_otf': False, 'bitrate': record['bitrate'], 'contentLength': '58000000'},
+                            Monostate(None, None, title=f'Video {idx}', duration=3600))
+            packages.append((stream, record['default_filename']))
+            timestamps.append(make_chapters(3600, 10))
+        return packages, timestamps
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    def compact(count):
+        jobs = []
+        for idx in range(count):
+            record = stream_record(idx)
+            job = Job(f'https://www.youtube.com/watch?v={idx:011d}')
+            job.video_id, job.itag, job.stream_url = f'{idx:011d}', record['itag'], record['url']
+            job.file_name, job.timestamps = record['default_filename'], make_chapters(3600, 10)
+            job.source = (None, 'opus', 150000)
+            jobs.append(job)
+        return jobs
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    def manager_appends(packages, timestamps):
+        with Manager() as manager:
+            shared_packages, shared_timestamps = manager.list(), manager.list()
+            for package, timestamp in zip(packages, timestamps):
+                shared_packages.append(package)
+                shared_timestamps.append(timestamp)
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    (packages, timestamps), legacy_memory = peak_memory(legacy, count)
+    jobs, compact_memory = peak_memory(compact, count)
+
+    legacy_bytes = sum(len(pickle.dumps(package)) + len(pickle.dumps(timestamp))
+                       for package, timestamp in zip(packages, timestamps))
+    compact_bytes = sum(len(pickle.dumps(job)) for job in jobs)
+
+    # Both record types make the same round trip through a pipe to another process, the Manager appends are what the
+    # old code paid on top of that and have no Job counterpart since jobs no longer cross process boundaries
+    legacy_ipc = pipe_round_trip(list(zip(packages[:ipc_count], timestamps[:ipc_count])))
+    compact_ipc = pipe_round_trip(jobs[:ipc_count])
+    manager_ipc = timed(manager_appends, packages[:ipc_count], timestamps[:ipc_count]) / ipc_count
+
+    results = {
+        'legacy': {'memory': legacy_memory / count, 'pickled': legacy_bytes / count, 'ipc': legacy_ipc,
+                   'manager': manager_ipc},
+        'compact': {'memory': compact_memory / count, 'pickled': compact_bytes / count, 'ipc': compact_ipc},
+    }
+
+    print(f'\nPer-job cost over {count} jobs (IPC over {ipc_count} pipe round trips to another process)')
+    for name, result in results.items():
+        print(f'{name:<8} {result["memory"]:8.0f} B memory  {result["pickled"]:8.0f} B pickled  '
+              f'{result["ipc"] * 1e6:8.1f} us round trip')
+    print(f'legacy Manager list appends: {manager_ipc * 1e6:.1f} us per job')
+
+    return results
+
+
+# =======================================================================================================================
+
+def bench_pipeline(scales=(10, 100, 1000), chapters=(0, 4), duration=10, filetype='mp3', bitrate='',
+                   output='bench_pipeline.json'):
+    workspace = tempfile.mkdtemp()
+    results = []
+    try:
+        source = os.path.join(workspace, 'source.m4a')
+        generate_audio(source, duration)
+        server = MediaServer({'source.m4a': source})
+
+        for count in scales:
+            for chapter_count in chapters:
+                dpath = os.path.join(workspace, f'out_{count}_{chapter_count}')
+                with OfflineBackend(server, duration, chapter_count) as backend, StageTimer() as timer:
+                    downloader = Downloader({'dts': int(chapter_count > 0), 'ncache': 1, 'redo': 1})
+
+                    cpu_start = cpu_seconds()
+                    start = perf_counter()
+                    # ru_maxrss only ever grows over the process lifetime, so each configuration samples its own peak
+                    outcome, rss = peak_rss(downloader.run, [backend.playlist(count)], filetype, bitrate, dpath,
+                                            processes=child_pids)
+                    wall = perf_counter() - start
+                    cpu = cpu_seconds()
+
+                shutil.rmtree(dpath)
+
+                converted = [result for result in outcome if result['status'] == 'converted']
+                transferred = sum(result['filesize'] or 0 for result in converted)
+                results.append({
+                    'videos': count,
+                    'chapters': chapter_count,
+                    'converted': len(converted),
+                    'wall': wall,
+                    'videos_per_second': len(converted) / wall,
+                    'bytes_per_second': transferred / wall,
+                    'cpu_utilization': (cpu - cpu_start) / (wall * os.cpu_count()),
+                    'peak_rss_kb': rss,
+                    'stages': timer.report(),
+                })
+
+        server.close()
+    finally:
+        shutil.rmtree(workspace)
+
+    print(f'\n{"videos":>7} {"chapters":>8} {"wall":>8} {"videos/s":>9} {"MB/s":>7} {"cpu":>5} {"rss MB":>7}  stages (busy s)')
+    for result in results:
+        stages = '  '.join(f'{name} {stage["busy"]:.1f}' for name, stage in result['stages'].items())
+        print(f'{result["videos"]:>7} {result["chapters"]:>8} {result["wall"]:8.2f} {result["videos_per_second"]:9.1f} '
+              f'{result["bytes_per_second"] / 1e6:7.1f} {result["cpu_utilization"]:5.0%} '
+              f'{result["peak_rss_kb"] / 1024:7.1f}  {stages}')
+
+    if output is not None:
+        save_results(output, 'pipeline', results)
+
+    return results
+
+
+# =======================================================================================================================
+
+def bench_workers(cores=(1, 2, None), count=48, duration=10, latency=.05, filetype='mp3', bitrate='',
+                  output='bench_workers.json'):
+    settings = {
+        'fproc (1, 2/3)': {'fproc': (1, 2 / 3)},
+        'fproc (2, 1)': {'fproc': (2, 1)},
+        'adaptive': {},
+    }
+    available = sorted(os.sched_getaffinity(0))
+
+    workspace = tempfile.mkdtemp()
+    results = []
+    try:
+        source = os.path.join(workspace, 'source.m4a')
+        generate_audio(source, duration)
+        server = MediaServer({'source.m4a': source}, latency)
+
+        for core_count in cores:
+            os.sched_setaffinity(0, available[:core_count or len(available)])
+
+            for name, options in settings.items():
+                dpath = os.path.join(workspace, 'out')
+                with OfflineBackend(server, duration, latency=latency) as backend:
+                    downloader = Downloader(dict(options, ncache=1, redo=1))
+                    start = perf_counter()
+                    outcome = downloader.run([backend.playlist(count)], filetype, bitrate, dpath)
+                    wall = perf_counter() - start
+
+                shutil.rmtree(dpath)
+
+                converted = sum(1 for result in outcome if result['status'] == 'converted')
+                results.append({
+                    'cores': len(os.sched_getaffinity(0)),
+                    'setting': name,
+                    'converted': converted,
+                    'wall': wall,
+                    'videos_per_second': converted / wall,
+                })
+
+        server.close()
+    finally:
+        os.sched_setaffinity(0, available)
+        shutil.rmtree(workspace)
+
+    print(f'\n{"cores":>5} {"setting":<16} {"converted":>9} {"wall":>8} {"videos/s":>9}')
+    for result in results:
+        print(f'{result["cores"]:>5} {result["setting"]:<16} {result["converted"]:>9} {result["wall"]:8.2f} '
+              f'{result["videos_per_second"]:9.1f}')
+
+    if output is not None:
+        save_results(output, 'workers', results)
+
+    return results
+
+
+# =======================================================================================================================
+
+def bench_metadata(count=2000, playlists=4, latency=.05, output='bench_metadata.json'):
+    def process_pool(jobs):
+        with Pool(os.cpu_count()) as p:
+            pool.append(p)
+            return p.map(fetch, jobs)
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    def thread_pipeline(jobs):
+        return Pipeline([(fetch, AdaptiveLimit(256, start=16), 'fetch_streams')]).run(jobs)
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    options = dict(Options.defaults(), ncache=1, redo=1)
+    fetch = partial(Downloader.fetch_streams, filetype=('mp3', 'audio'), options=options)
+    pool = []
+    results = {}
+
+    server = MediaServer({})
+    with OfflineBackend(server, 10, latency=latency) as backend:
+        downloader = Downloader(options)
+        urls = [backend.playlist(count // playlists, idx) for idx in range(playlists)]
+
+        start = perf_counter()
+        for url in urls:
+            Downloader.playlist_urls(url)
+        results['expand_serial'] = perf_counter() - start
+
+        start = perf_counter()
+        videos = downloader.expand_urls([(url, '') for url in urls])[0]
+        results['expand_parallel'] = perf_counter() - start
+
+        for name, function in (('process_pool', process_pool), ('thread_pipeline', thread_pipeline)):
+            start = perf_counter()
+            resolved, rss = peak_rss(function, [Job(url) for url in videos],
+                                     processes=lambda: [worker.pid for p in pool for worker in p._pool])
+            results[name] = {'seconds': perf_counter() - start, 'resolved': len(resolved), 'peak_rss_kb': rss}
+    server.close()
+
+    print(f'\nExpanding {playlists} playlists of {count // playlists} videos: {results["expand_serial"]:.2f} s serial, '
+          f'{results["expand_parallel"]:.2f} s parallel')
+    print(f'\n{"resolver":<16} {"videos":>7} {"seconds":>8} {"rss MB":>7}')
+    for name in ('process_pool', 'thread_pipeline'):
+        print(f'{name:<16} {results[name]["resolved"]:>7} {results[name]["seconds"]:8.2f} '
+              f'{results[name]["peak_rss_kb"] / 1024:7.1f}')
+
+    if output is not None:
+        save_results(output, 'metadata', results)
+
+    return results
+
+
+# =======================================================================================================================
+
+def bench_parser(lines=100000, chapters=9, output='bench_parser.json'):
+    def legacy(path):
+        with open(path, 'r') as r:
+            content = r.read()
+
+        urls = []
+        for line in content.splitlines():
+            if 'youtube.com' in line:
+                urls.append(line.strip())
+                content = content.replace(urls[-1] + '\n', '')
+
+        stamps_container = []
+        titles_container = []
+        temp_stamps = []
+        temp_titles = []
+        for line in content.splitlines():
+            line = line.split()
+            if len(line) == 0:
+                stamps_container.append(temp_stamps)
+                titles_container.append(temp_titles)
+                temp_stamps = []
+                temp_titles = []
+            else:
+                for idx, item in enumerate(line):
+                    if ':' in item:
+                        break
+
+                line = line[idx:]
+
+                stamp = line.pop(0).split(':')
+                try:
+                    if len(stamp) == 2:
+                        stamp = int(stamp[0]) * 60 + int(stamp[1])
+                    else:
+                        stamp = int(stamp[0]) * 3600 + int(stamp[1]) * 60 + int(stamp[2])
+                except ValueError:
+                    continue
+
+                temp_stamps.append(stamp)
+                temp_titles.append(' '.join(line))
+        stamps_container.append(temp_stamps)
+        titles_container.append(temp_titles)
+
+        return urls, [dict(zip(titles, stamps)) for titles, stamps in zip(titles_container, stamps_container)]
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    def streaming(path):
+        return list(Downloader.read_timestamp_file(path))
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    workspace = tempfile.mkdtemp()
+    results = {}
+    try:
+        path = os.path.join(workspace, 'timestamp_inputs.txt')
+        videos = lines // (chapters + 2)
+        with open(path, 'w') as w:
+            for idx in range(videos):
+                w.write(f'https://www.youtube.com/watch?v={idx:011d}\n')
+                for chapter in range(chapters):
+                    w.write(f'{chapter * 4 // 60:02d}:{chapter * 4 % 60:02d} Chapter {chapter + 1} of video {idx}\n')
+                w.write('\n')
+
+        url_path = os.path.join(workspace, 'url_inputs.txt')
+        with open(url_path, 'w') as w:
+            for idx in range(lines):
+                w.write(f'https://www.youtube.com/watch?v={idx:011d}\n')
+
+        for name, function in (('legacy', legacy), ('streaming', streaming)):
+            parsed, peak = peak_memory(function, path)
+            start = perf_counter()
+            function(path)
+            seconds = perf_counter() - start
+            jobs = len(parsed[0]) if name == 'legacy' else len(parsed)
+            results[name] = {'jobs': jobs, 'seconds': seconds, 'peak_bytes': peak}
+
+        start = perf_counter()
+        for _ in Downloader.read_url_file(url_path):
+            pass
+        results['url_file'] = {'jobs': lines, 'seconds': perf_counter() - start}
+    finally:
+        shutil.rmtree(workspace)
+
+    print(f'\nTimestamp file with {videos} videos and {videos * (chapters + 2)} lines')
+    print(f'{"parser":<10} {"jobs":>7} {"seconds":>8} {"peak MB":>8}')
+    for name in ('legacy', 'streaming'):
+        print(f'{name:<10} {results[name]["jobs"]:>7} {results[name]["seconds"]:8.3f} '
+              f'{results[name]["peak_bytes"] / 1e6:8.1f}')
+    print(f'\nURL file with {lines} lines: {results["url_file"]["seconds"]:.3f} s')
+
+    if output is not None:
+        save_results(output, 'parser', results)
+
+    return results
+
+
+# =======================================================================================================================
+
+def bench_queue(workers=(1, 2, 4), count=32, duration=10, latency=.05, filetype='mp3', output='bench_queue.json'):
+    def drain(path, dpath, idx):
+        queue = WorkQueue(path)
+        downloader = Downloader({'ncache': 1, 'redo': 1})
+        downloader.work(queue, f'bench-{idx}', dpath, batch=4, poll=.2)
+        downloader.close()
+        queue.close()
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    workspace = tempfile.mkdtemp()
+    context = get_context('fork')
+    results = []
+    try:
+        source = os.path.join(workspace, 'source.m4a')
+        generate_audio(source, duration)
+        server = MediaServer({'source.m4a': source}, latency)
+
+        for worker_count in workers:
+            path = os.path.join(workspace, f'queue_{worker_count}.sqlite')
+            dpath = os.path.join(workspace, f'out_{worker_count}')
+            with OfflineBackend(server, duration, latency=latency) as backend:
+                queue = WorkQueue(path)
+                coordinator = Downloader({'ncache': 1, 'redo': 1})
+                coordinator.enqueue(queue, [backend.playlist(count)], filetype)
+                coordinator.close()
+
+                # Forked workers inherit the patched backend, the media server keeps running in this process
+                start = perf_counter()
+                processes = [context.Process(target=drain, args=(path, dpath, idx)) for idx in range(worker_count)]
+                for process in processes:
+                    process.start()
+                for process in processes:
+                    process.join()
+                wall = perf_counter() - start
+
+                counts = queue.counts()
+                queue.close()
+
+            results.append({
+                'workers': worker_count,
+                'done': counts.get('done', 0),
+                'failed': counts.get('failed', 0),
+                'wall': wall,
+                'videos_per_second': counts.get('done', 0) / wall,
+            })
+
+        server.close()
+    finally:
+        shutil.rmtree(workspace)
+
+    print(f'\n{"workers":>7} {"done":>5} {"failed":>6} {"wall":>8} {"videos/s":>9}')
+    for result in results:
+        print(f'{result["workers"]:>7} {result["done"]:>5} {result["failed"]:>6} {result["wall"]:8.2f} '
+              f'{result["videos_per_second"]:9.1f}')
+
+    if output is not None:
+        save_results(output, 'queue', results)
+
+    return results
+
+
+# =======================================================================================================================
+
+def bench_startup(runs=10, target=.150, output='bench_startup.json'):
+    def first_prompt():
+        start = perf_counter()
+        process = subprocess.Popen([sys.executable, script], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL, cwd=directory)
+        seen = b''
+        while b'>>' not in seen:
+            chunk = process.stdout.read1(4096)
+            if chunk == b'':
+                break
+            seen += chunk
+        elapsed = perf_counter() - start
+
+        process.kill()
+        process.wait()
+        return elapsed
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    def first_job():
+        start = perf_counter()
+        subprocess.run([sys.executable, '-c', job_script], cwd=directory, check=True, stdout=subprocess.DEVNULL)
+        return perf_counter() - start
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    def median(function):
+        times = sorted(function() for _ in range(runs))
+        return times[len(times) // 2]
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    directory = os.path.dirname(os.path.abspath(downloader_v3.__file__))
+    script = os.path.join(directory, 'downloader_v3.py')
+    cached = os.path.join(directory, 'ffmpeg_location.json')
+    # The download archive stays enabled as in a default run, its lookup sits between startup and the first job
+    job_script = ("import downloader_v3 as d\n"
+                  "downloader = d.Downloader({'ncache': 1})\n"
+                  "downloader.targets = downloader.parse_targets('mp3')\n"
+                  "downloader.filetype, downloader.bitrate = downloader.source_target(downloader.targets)\n"
+                  "downloader.urls, downloader.timestamps = downloader.expand_urls([('https://youtu.be/dQw4w9WgXcQ', '')])\n"
+                  "next(downloader.pending_jobs())\n")
+
+    results = {'interpreter': median(lambda: timed(subprocess.run, [sys.executable, '-c', 'pass'], check=True))}
+
+    # The cold run has to find and probe ffmpeg, every run after it reads the stored location
+    if os.path.exists(cached):
+        os.remove(cached)
+    results['first_job_cold'] = first_job()
+    results['first_job'] = median(first_job)
+    results['first_prompt'] = median(first_prompt)
+
+    print(f'\n{"measurement":<16} {"ms":>8}')
+    for name, seconds in results.items():
+        print(f'{name:<16} {seconds * 1000:8.1f}')
+    print(f'\nTarget {target * 1000:.0f} ms: '
+          + ('met' if max(results['first_job'], results['first_prompt']) < target else 'missed'))
+
+    if output is not None:
+        save_results(output, 'startup', results)
+
+    return results
+
+
+# =======================================================================================================================
+
+def bench_autosplit(duration=10800, track=300, gap=2, output='bench_autosplit.json'):
+    def decode_only(path):
+        subprocess.run(['ffmpeg', '-v', 'error', '-i', path, '-vn', '-ac', '1', '-ar', str(detector.rate), '-f', 'null',
+                        '-'], check=True)
+        return None
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    def silencedetect(path, rate=None):
+        resample = f'aresample={rate},pan=mono|c0=c0,' if rate is not None else ''
+        result = subprocess.run(['ffmpeg', '-nostats', '-i', path, '-vn', '-af',
+                                 f'{resample}silencedetect=noise={detector.threshold}dB:d={detector.min_silence}',
+                                 '-f', 'null', '-'], capture_output=True, text=True)
+        starts = [float(value) for value in re.findall(r'silence_start: (-?[\d.]+)', result.stderr)]
+        ends = [float(value) for value in re.findall(r'silence_end: ([\d.]+)', result.stderr)]
+        return [round((start + end) / 2, 2) for start, end in zip(starts, ends) if 0 < start and end < duration]
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    def numpy_rms(path):
+        return [stamps[0] for stamps in list(detector.chapters(path).values())[1:]]
+
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    workspace = tempfile.mkdtemp()
+    detector = downloader_v3.SilenceDetector()
+    results = {}
+    try:
+        # A tone that drops out for the last few seconds of every track, so the true cuts are known up front
+        source = os.path.join(workspace, 'mix.m4a')
+        os.system(f'ffmpeg -y -loglevel error -f lavfi -i "aevalsrc=0.5*sin(440*2*PI*t)*lt(mod(t\\,{track})\\,'
+                  f'{track - gap}):s=44100:d={duration}" -ac 2 -c:a aac -b:a 96k "{source}"')
+        expected = [idx * track - gap / 2 for idx in range(1, duration // track)]
+
+        for name, function in (('decode_only', decode_only),
+                               ('silencedetect', silencedetect),
+                               ('silencedetect_8k_mono', partial(silencedetect, rate=detector.rate)),
+                               ('numpy_rms', numpy_rms)):
+            start, cpu = perf_counter(), cpu_seconds()
+            cuts = function(source)
+            result = {'seconds': perf_counter() - start, 'cpu_seconds': cpu_seconds() - cpu}
+            if cuts is not None:
+                result['cuts'] = len(cuts)
+                result['max_error'] = max(min(abs(cut - stamp) for cut in cuts) for stamp in expected) \
+                    if len(cuts) > 0 else None
+            results[name] = result
+    finally:
+        shutil.rmtree(workspace)
+
+    print(f'\nFinding {duration // track - 1} track boundaries in {duration / 3600:.1f} h of audio')
+    print(f'{"method":<22} {"seconds":>8} {"cpu s":>8} {"cuts":>5} {"max error s":>12}')
+    for name, result in results.items():
+        error = f'{result["max_error"]:.2f}' if result.get('max_error') is not None else '-'
+        print(f'{name:<22} {result["seconds"]:8.2f} {result["cpu_seconds"]:8.2f} {result.get("cuts", "-"):>5} '
+              f'{error:>12}')
+
+    if output is not None:
+        save_results(output, 'autosplit', results)
+
+    return results
+
+
+# =======================================================================================================================
+
+def bench_targets(targets=('mp3:128', 'mp3:320', 'ogg'), count=8, duration=120, chapters=(0, 4),
+                  output='bench_targets.json'):
+    def produce(backend, dpath, filetype, chapter_count):
+        downloader = Downloader({'ncache': 1, 'redo': 1, 'dts': int(chapter_count > 0)})
+        outcome = downloader.run([backend.playlist(count)], filetype, '', dpath)
+        transferred = downloader.transport.metrics()['bytes']
+        downloader.close()
+        return sum(1 for result in outcome if result['status'] == 'converted'), transferred
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    workspace = tempfile.mkdtemp()
+    results = []
+    try:
+        source = os.path.join(workspace, 'source.m4a')
+        generate_audio(source, duration)
+        server = MediaServer({'source.m4a': source})
+
+        for chapter_count in chapters:
+            runs = {'separate': [[target] for target in targets], 'multi_target': [list(targets)]}
+            for name, groups in runs.items():
+                dpath = os.path.join(workspace, 'out')
+                with OfflineBackend(server, duration, chapters=chapter_count) as backend:
+                    start, cpu = perf_counter(), cpu_seconds()
+                    produced = [produce(backend, dpath, ','.join(group), chapter_count) for group in groups]
+                    wall, cpu = perf_counter() - start, cpu_seconds() - cpu
+
+                files = sum(len(names) for _, _, names in os.walk(dpath))
+                shutil.rmtree(dpath)
+
+                results.append({
+                    'chapters': chapter_count,
+                    'mode': name,
+                    'runs': len(groups),
+                    'converted': sum(converted for converted, _ in produced),
+                    'files': files,
+                    'downloaded_bytes': sum(transferred for _, transferred in produced),
+                    'wall': wall,
+                    'cpu': cpu,
+                })
+
+        server.close()
+    finally:
+        shutil.rmtree(workspace)
+
+    print(f'\n{count} videos of {duration}s to {", ".join(targets)}')
+    print(f'{"chapters":>8} {"mode":<13} {"runs":>4} {"files":>6} {"MB in":>7} {"wall":>8} {"cpu":>8}')
+    for result in results:
+        print(f'{result["chapters"]:>8} {result["mode"]:<13} {result["runs"]:>4} {result["files"]:>6} '
+              f'{result["downloaded_bytes"] / 1e6:7.1f} {result["wall"]:8.2f} {result["cpu"]:8.2f}')
+
+    if output is not None:
+        save_results(output, 'targets', results)
+
+    return results
+
+
+# =======================================================================================================================
+
+BENCHMARKS = {
+    'split': bench_split,
+    'jobs': bench_jobs,
+    'pipeline': bench_pipeline,
+    'workers': bench_workers,
+    'metadata': bench_metadata,
+    'parser': bench_parser,
+    'queue': bench_queue,
+    'startup': bench_startup,
+    'autosplit': bench_autosplit,
+    'targets': bench_targets,
+}
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -1,15 +1,77 @@
 import sys
 import os
-import requests
+import argparse
+import shutil
 import glob
-from pytube import YouTube, Playlist
-from multiprocessing import Pool, Manager, freeze_support
-from itertools import repeat
-from time import sleep
+import re
+import json
+import hashlib
+import sqlite3
+import subprocess
+import socket
+import importlib
+from multiprocessing import freeze_support
+from functools import partial
+from threading import Thread, Lock, Condition, BoundedSemaphore, Event, current_thread
+from contextlib import contextmanager, nullcontext
+from queue import Queue
+from io import BytesIO
+from urllib.parse import urlparse, parse_qs
+from urllib.error import HTTPError, URLError
+from random import random
+from time import sleep, time, perf_counter
+
+# =======================================================================================================================
+
+class LazyImport:
+    def __init__(self, module, attribute=None, setup=None):
+        self.module = module
+        self.attribute = attribute
+        self.setup = setup
+        self.target = None
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def resolve(self):
+        if self.target is None:
+            target = importlib.import_module(self.module)
+            if self.setup is not None:
+                self.setup()
+            self.target = getattr(target, self.attribute) if self.attribute is not None else target
+
+        return self.target
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+
+        return getattr(self.resolve(), name)
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+
+# requests and pytube account for most of the import time, so they load on first use instead of at launch
+requests = LazyImport('requests')
+extract = LazyImport('pytube.extract')
+youtube_exceptions = LazyImport('pytube.exceptions')
+innertube = LazyImport('pytube.innertube')
+YouTube = LazyImport('pytube', 'YouTube', setup=lambda: Transport.patch_pytube())
+Playlist = LazyImport('pytube', 'Playlist', setup=lambda: Transport.patch_pytube())
+ThreadPool = LazyImport('multiprocessing.pool', 'ThreadPool')
+http_server = LazyImport('http.server')
+numpy = LazyImport('numpy')
 
 # =======================================================================================================================
 
 class Options:
+    URL_TEMPLATE = 'Paste video/playlist URLs in this text file, each on a new line\n'
+    TIMESTAMP_TEMPLATE = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ\n00:00 Name of Timestamp 1\n04:20 Name of Timestamp 2\n\nhttps://www.youtube.com/watch?v=FveF-we6lcE\n00:00 Name of Timestamp 1\netc.\n'
+
     def __init__(self, workspace):
         self.workspace = workspace
         self.options = self.option_select()
@@ -23,11 +85,19 @@ class Options:
             print('ts - generates a timestamp text file by which you input urls and timestamps accordingly')
             print()
             print('dts - if any of the given videos have timestamps in their descriptions, video will be stripped into its respective timestamps')
+            print('ats - videos left without timestamps are split into tracks at the silences between them (needs numpy)')
             print()
             print('dp - specify a custom video download path')
             print('fdry - will search for the default Foundry installation path and download files to its location if found')
             print()
-            print('fproc - increase processing time at the risk of increased processor strain. If the app crashes, this is why :)')
+            print('fproc - use fixed worker pools at twice the core count instead of sizing them from observed throughput')
+            print('spar - split timestamped videos across parallel ffmpeg processes instead of a single pass (best for a few long videos)')
+            print()
+            print('ncache - ignore the metadata cache and look every video and playlist up on YouTube again')
+            print('redo - process videos again even if the download archive lists them as finished')
+            print()
+            print('pipe - stream downloads straight into ffmpeg without keeping the source file (timestamped videos still use one)')
+            print('trace - write per-video stage timings to trace.jsonl and trace.chrome.json and print a summary')
             print()
             print('Ensure you separate multiple option inputs with commas')
             print('Press enter if you do not wish to select any options')
@@ -36,13 +106,9 @@ class Options:
 
         # --------------------------------------------
 
-        selection = ['urltxt', 'ts', 'dts', 'dp', 'fdry', 'fproc']
-        option_dict = {}
-        for item in selection:
-            if item == 'fproc':
-                option_dict[item] = (1, 2 / 3)
-            else:
-                option_dict[item] = 0
+        option_dict = self.defaults()
+        # Someone is at the keyboard to finish the OAuth device login if pytube has no token yet
+        option_dict['oauth'] = 1
 
         while True:
             options = input(
@@ -67,6 +133,8 @@ class Options:
 
             elif option == 'dts':
                 option_dict['dts'] = 1
+            elif option == 'ats':
+                option_dict['ats'] = 1
 
             elif option == 'dp':
                 if option_dict['fdry'] == 0:
@@ -79,6 +147,16 @@ class Options:
 
             elif option == 'fproc':
                 option_dict['fproc'] = (2, 1)
+            elif option == 'spar':
+                option_dict['spar'] = 1
+            elif option == 'ncache':
+                option_dict['ncache'] = 1
+            elif option == 'redo':
+                option_dict['redo'] = 1
+            elif option == 'pipe':
+                option_dict['pipe'] = 1
+            elif option == 'trace':
+                option_dict['trace'] = 1
             elif option == '':
                 pass
             else:
@@ -88,11 +166,23 @@ class Options:
 
     # -----------------------------------------------------------------------------------------------------------------------
 
+    @staticmethod
+    def defaults():
+        selection = ['urltxt', 'ts', 'dts', 'ats', 'dp', 'fdry', 'fproc', 'spar', 'ncache', 'redo', 'pipe', 'trace', 'oauth',
+                     'cache_ttl', 'cache_size']
+        option_dict = {}
+        for item in selection:
+            option_dict[item] = 0
+
+        return option_dict
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
     def urltxt(self):
         def create_file():
             print('\nCreating url_inputs.txt...')
             with open(txtpath, 'w') as w:
-                w.write('Paste video/playlist URLs in this text file, each on a new line\n')
+                w.write(Options.URL_TEMPLATE)
 
             input('\nInput URLs in the url_inputs.txt file and then press enter\n>> ')
 
@@ -120,8 +210,7 @@ class Options:
         def create_file():
             print('\nCreating timestamp_inputs.txt...')
             with open(tspath, 'w') as w:
-                w.write(
-                    'https://www.youtube.com/watch?v=dQw4w9WgXcQ\n00:00 Name of Timestamp 1\n04:20 Name of Timestamp 2\n\nhttps://www.youtube.com/watch?v=FveF-we6lcE\n00:00 Name of Timestamp 1\netc.\n')
+                w.write(Options.TIMESTAMP_TEMPLATE)
 
             input('\nInput URLs and timestamps in the timestamp_inputs.txt file and then press enter\n>> ')
 
@@ -167,391 +256,2691 @@ class Options:
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-class Downloader:
-    def __init__(self):
-        self.workspace = {}
-        self.runflag = 1
+class MetadataCache:
+    TTL = {
+        'video': 7 * 24 * 3600,
+        'playlist': 24 * 3600,
+        'streams': 5 * 3600,
+    }
 
-        if self.check_install() == 0:
-            self.runflag = 0
-            self.options = Options(self.workspace).options
-            self.urls, self.filetype, self.bitrate, self.timestamps = self.user_input(self.options)
+    UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 24 * 3600}
+
+    def __init__(self, path, ttl=None, max_entries=20000):
+        self.ttl = dict(self.TTL, **(ttl or {}))
+        self.max_entries = max_entries
+        self.lock = Lock()
+        self.accessed = {}
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS entries '
+                                '(kind TEXT, key TEXT, data TEXT, stored REAL, accessed REAL, PRIMARY KEY (kind, key))')
+        self.connection.commit()
+
+        self.evict()
 
     # -----------------------------------------------------------------------------------------------------------------------
 
-    def check_install(self):
-        DLINK = r'https://www.gyan.dev/ffmpeg/builds/ffmpeg-git-essentials.7z'
-        extraction_flag = 0
+    def get(self, kind, key):
+        with self.lock:
+            row = self.connection.execute('SELECT data, stored FROM entries WHERE kind = ? AND key = ?',
+                                          (kind, key)).fetchone()
+            if row is None or time() - row[1] > self.ttl[kind]:
+                return None
 
-        if getattr(sys, 'frozen', False):
-            current_dir = os.path.dirname(sys.executable)
-        else:
-            current_dir = os.path.dirname(__file__)
-        ffmpeg_drive_dir = os.path.join(current_dir, 'ffmpeg')
+            # Access times only order eviction, so hits stay in memory and go out with the next write instead of
+            # committing on every lookup
+            self.accessed[(kind, key)] = time()
 
-        if not os.path.exists(ffmpeg_drive_dir):
-            print('\nffmpeg is required for this script to function.')
-            consent = input(f'Allow its installation in the file directory? ([y]/n)\n>> ').lower()
+        return json.loads(row[0])
 
-            if 'y' in consent or consent == '' or consent == ' ':
-                pass
-            else:
-                return True
+    # -----------------------------------------------------------------------------------------------------------------------
 
-            os.system(f"mkdir {ffmpeg_drive_dir}")
+    def set(self, kind, key, data):
+        now = time()
+        with self.lock:
+            self.flush_accessed()
+            self.connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                                    (kind, key, json.dumps(data), now, now))
+            self.connection.commit()
 
-            print('\nObtaining ffmpeg...')
-            ffmpeg_zip = 'ffmpeg.7z'
-            with requests.get(DLINK, stream=True) as r:
-                r.raise_for_status()
-                with open(ffmpeg_zip, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
+    # -----------------------------------------------------------------------------------------------------------------------
 
-            input('Done. Press enter once you\'ve extracted the contents of the zip file to the "ffmpeg" folder\n>> ')
+    def delete(self, kind, key):
+        with self.lock:
+            self.connection.execute('DELETE FROM entries WHERE kind = ? AND key = ?', (kind, key))
+            self.connection.commit()
 
-            files = glob.glob(os.path.join(current_dir, 'ffmpeg', '*'))
-            if len(files) == 0:
-                extraction_flag = 1
-            else:
-                try:
-                    os.remove(ffmpeg_zip)
-                except FileNotFoundError:
-                    pass
+    # -----------------------------------------------------------------------------------------------------------------------
 
-        files = glob.glob(os.path.join(current_dir, 'ffmpeg', '*'))
-        if len(files) == 1:
-            file = files[0]
-            ffmpeg_path = os.path.join(current_dir, 'ffmpeg', file, 'bin')
-        elif len(files) == 0:
-            extraction_flag = 1
+    def evict(self):
+        now = time()
+        with self.lock:
+            self.flush_accessed()
+            for kind, ttl in self.ttl.items():
+                self.connection.execute('DELETE FROM entries WHERE kind = ? AND stored < ?', (kind, now - ttl))
+
+            self.connection.execute('DELETE FROM entries WHERE rowid IN '
+                                    '(SELECT rowid FROM entries ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                                    (self.max_entries,))
+            self.connection.commit()
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def flush_accessed(self):
+        self.connection.executemany('UPDATE entries SET accessed = ? WHERE kind = ? AND key = ?',
+                                    ((accessed, kind, key) for (kind, key), accessed in self.accessed.items()))
+        self.accessed = {}
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def close(self):
+        self.evict()
+        self.connection.close()
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def parse_ttl(ttl):
+        # 'video=14d,streams=2h' or {'video': '14d', 'streams': 7200}, plain numbers are seconds
+        entries = ttl.split(',') if type(ttl) == str else ttl.items()
+
+        parsed = {}
+        for entry in entries:
+            kind, value = entry.split('=', 1) if type(entry) == str else entry
+            kind, value = kind.strip(), str(value).strip().lower()
+            if kind not in MetadataCache.TTL:
+                raise ValueError(f'Unknown cache entry kind {kind}')
+            parsed[kind] = float(value.rstrip('smhd')) * MetadataCache.UNITS.get(value[-1:], 1)
+
+        return parsed
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class Archive:
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+        self.entries = set()
+
+        if os.path.exists(path):
+            with open(path, 'r') as r:
+                self.entries = {line.strip() for line in r if line.strip() != ''}
+
+        # Opened for appending once up front, so an unwritable archive fails before any video is downloaded
+        open(path, 'a').close()
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def add(self, key):
+        with self.lock:
+            if key in self.entries:
+                return
+
+            self.entries.add(key)
+            with open(self.path, 'a') as a:
+                a.write(key + '\n')
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def key(url, targets, options, ts):
+        # The same video ID parser that deduplicates the batch, so checking the archive never has to load pytube
+        kind, video_id, url = Downloader.canonical_url(url)
+        if kind != 'video':
+            return None
+
+        if options['dts'] == 1:
+            chapters = 'dts'
+        elif ts != '':
+            chapters = hashlib.sha1(json.dumps(ts).encode()).hexdigest()[:12]
+        elif options['ats'] == 1:
+            chapters = 'ats'
         else:
-            ffmpeg_path = os.path.join(current_dir, 'ffmpeg', 'bin')
+            chapters = 'full'
 
-        os.environ["PATH"] += os.pathsep + ffmpeg_path
+        filetypes = '+'.join(filetype[0] for filetype, bitrate in targets)
+        bitrates = '+'.join(bitrate or 'max' for filetype, bitrate in targets)
 
-        self.workspace['fpath'] = current_dir
+        return f'{video_id} {filetypes} {bitrates} {chapters}'
 
-        return extraction_flag
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class WorkQueue:
+    def __init__(self, path, max_attempts=3):
+        self.max_attempts = max_attempts
+        self.lock = Lock()
+
+        # Autocommit mode so every change is its own short transaction, lease takes an IMMEDIATE write lock itself.
+        # WAL lets workers read counts while another one holds the write lock. WAL needs shared memory between all
+        # connections, so the file has to sit on a local disk of one host, other machines go through QueueServer
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS jobs '
+                                '(id INTEGER PRIMARY KEY, url TEXT, chapters TEXT, filetype TEXT, bitrate TEXT, '
+                                'status TEXT, worker TEXT, lease_until REAL, attempts INTEGER, result TEXT, '
+                                'enqueued REAL, updated REAL, UNIQUE (url, chapters, filetype, bitrate))')
 
     # -----------------------------------------------------------------------------------------------------------------------
 
-    def user_input(self, options):
-        def url_input():
-            processed_urls = []
-            playlist = []
-            stamps_container = []
-            titles_container = []
+    def enqueue(self, jobs, filetype, bitrate=''):
+        now = time()
+        with self.lock:
+            before = self.connection.total_changes
+            self.connection.execute('BEGIN IMMEDIATE')
+            # Done, queued and leased jobs are left alone, a job that failed before gets a fresh set of attempts
+            self.connection.executemany(
+                "INSERT INTO jobs (url, chapters, filetype, bitrate, status, attempts, enqueued, updated) "
+                "VALUES (?, ?, ?, ?, 'queued', 0, ?, ?) ON CONFLICT (url, chapters, filetype, bitrate) DO UPDATE SET "
+                "status = 'queued', attempts = 0, worker = NULL, lease_until = NULL, result = NULL, "
+                "updated = excluded.updated WHERE status = 'failed'",
+                ((url, json.dumps(chapters), filetype, bitrate, now, now) for url, chapters in jobs))
+            self.connection.execute('COMMIT')
+
+            return self.connection.total_changes - before
 
-            if options['urltxt'] == 1:
-                with open(self.workspace['urltxt'], 'r') as r:
-                    urls = r.read().replace('Paste video/playlist URLs in this text file, each on a new line',
-                                            '').strip().splitlines()
-            elif options['ts'] == 1:
-                with open('timestamp_inputs.txt', 'r') as r:
-                    content = r.read().replace(
-                        'https://www.youtube.com/watch?v=dQw4w9WgXcQ\n00:00 Name of Timestamp 1\n04:20 Name of Timestamp 2\n\nhttps://www.youtube.com/watch?v=FveF-we6lcE\n00:00 Name of Timestamp 1\netc.',
-                        '').strip()
-
-                urls = []
-                for line in content.splitlines():
-                    if 'youtube.com' in line:
-                        urls.append(line.strip())
-                        content = content.replace(urls[-1] + '\n', '')
-
-                stamps_container = []
-                titles_container = []
-                temp_stamps = []
-                temp_titles = []
-                for line in content.splitlines():
-                    line = line.split()
-                    if len(line) == 0:
-                        stamps_container.append(temp_stamps)
-                        titles_container.append(temp_titles)
-                        temp_stamps = []
-                        temp_titles = []
-                    else:
-                        for idx, item in enumerate(line):
-                            if ':' in item:
-                                break
-
-                        line = line[idx:]
-
-                        stamp = line.pop(0)
-                        stamp = stamp.split(':')
-                        try:
-                            if len(stamp) == 2:
-                                stamp = int(stamp[0]) * 60 + int(stamp[1])
-                            else:
-                                stamp = int(stamp[0]) * 3600 + int(stamp[1]) * 60 + int(stamp[2])
-                        except ValueError:
-                            continue
+    # -----------------------------------------------------------------------------------------------------------------------
 
-                        temp_stamps.append(stamp)
-                        temp_titles.append(' '.join(line))
-                stamps_container.append(temp_stamps)
-                titles_container.append(temp_titles)
-            else:
-                urls = input('\nEnter video/playlist URL (comma separated for multiple)\n>> ').split(',')
+    def lease(self, worker, count=1, timeout=900):
+        now = time()
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                # A lease that ran out belongs to a worker that crashed or hung, its job goes back in the queue
+                # unless it already used up its attempts
+                self.connection.execute("UPDATE jobs SET status = 'failed', worker = NULL, updated = ?, "
+                                        "result = json_object('status', 'failed', 'error', 'lease expired') "
+                                        "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+                                        (now, now, self.max_attempts))
+                self.connection.execute("UPDATE jobs SET status = 'queued', worker = NULL, updated = ? "
+                                        "WHERE status = 'leased' AND lease_until < ?", (now, now))
+
+                rows = self.connection.execute("SELECT id, url, chapters, filetype, bitrate FROM jobs "
+                                               "WHERE status = 'queued' ORDER BY id LIMIT ?", (count,)).fetchall()
+                self.connection.executemany("UPDATE jobs SET status = 'leased', worker = ?, lease_until = ?, "
+                                            "attempts = attempts + 1, updated = ? WHERE id = ?",
+                                            ((worker, now + timeout, now, row[0]) for row in rows))
+                self.connection.execute('COMMIT')
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
+
+        return [{'id': row[0], 'url': row[1], 'chapters': json.loads(row[2]), 'filetype': row[3], 'bitrate': row[4]}
+                for row in rows]
 
-            for url in urls:
-                if 'playlist' in url:
-                    playlist += list(Playlist(url).video_urls)
-                else:
-                    url = url.split('&')[0].strip()
-                    if 'youtu.be' in url:
-                        url = 'https://www.youtube.com/watch?v=' + url.split('/')[-1]
-                    elif 'https' not in url:
-                        url = 'https://' + url
-                    processed_urls.append(url)
-
-            processed_urls += playlist
-
-            stamp_flag = 0
-            for stamp in stamps_container:
-                if stamp != '':
-                    stamp_flag = 1
-                    break
+    # -----------------------------------------------------------------------------------------------------------------------
 
-            if stamp_flag == 0:
-                return processed_urls, ['']*len(processed_urls)
-            else:
-                timestamp_container = []
-                for idx, item in enumerate(titles_container):
-                    timestamp_container.append(dict(zip(titles_container[idx], stamps_container[idx])))
+    def heartbeat(self, ids, worker, timeout=900):
+        with self.lock:
+            self.connection.executemany("UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND "
+                                        "status = 'leased'", ((time() + timeout, idx, worker) for idx in ids))
 
-                return processed_urls, timestamp_container
+    # -----------------------------------------------------------------------------------------------------------------------
 
-        # ---------------------------------------------------------------------------------------------------------------
+    def release(self, ids, worker):
+        # Hands leased jobs back untouched, the lease does not count as an attempt
+        with self.lock:
+            self.connection.executemany("UPDATE jobs SET status = 'queued', worker = NULL, attempts = attempts - 1, "
+                                        "updated = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                                        ((time(), idx, worker) for idx in ids))
 
-        def filetype_input():
-            while True:
-                filetype = input('\nSelect file format\n>> ').lower().replace('.', '')
-                if filetype in ['mp4', 'webm']:
-                    filetype = (f'{filetype}', 'video')
-                    break
-                elif filetype in ['mp3', 'ogg', 'wav']:
-                    filetype = (f'{filetype}', 'audio')
-                    break
-                else:
-                    print(f'\nFiletype .{filetype} not supported')
+    # -----------------------------------------------------------------------------------------------------------------------
 
-            return filetype
+    def complete(self, idx, worker, result):
+        status = 'done' if result.get('status') in ('converted', 'skipped') else 'failed'
+        with self.lock:
+            # A worker whose lease already expired must not overwrite the job another worker has taken over
+            self.connection.execute("UPDATE jobs SET status = ?, result = ?, worker = NULL, updated = ? "
+                                    "WHERE id = ? AND worker = ? AND status = 'leased'",
+                                    (status, json.dumps(result), time(), idx, worker))
 
-        # ---------------------------------------------------------------------------------------------------------------
+    # -----------------------------------------------------------------------------------------------------------------------
 
-        def bitrate_input():
-            while True:
-                bitrate = input('\nInput desired bitrate in kbps (Press enter for max)\n>> ').lower().strip()
+    def counts(self):
+        with self.lock:
+            rows = self.connection.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+
+        return dict(rows)
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def results(self, status=None):
+        with self.lock:
+            rows = self.connection.execute('SELECT url, status, attempts, result FROM jobs WHERE ? IS NULL OR '
+                                           'status = ? ORDER BY id', (status, status)).fetchall()
+
+        return [dict(json.loads(result or '{}'), url=url, queue_status=status, attempts=attempts)
+                for url, status, attempts, result in rows]
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class QueueServer:
+    METHODS = ('enqueue', 'lease', 'heartbeat', 'release', 'complete', 'counts', 'results')
+
+    def __init__(self, queue, host='0.0.0.0', port=8765):
+        self.queue = queue
+
+        class Handler(http_server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
 
-                if bitrate == '' or bitrate == ' ':
-                    return ''
+            def do_POST(handler):
+                name = handler.path.strip('/')
+                if name not in self.METHODS:
+                    handler.send_error(404)
+                    return
 
                 try:
-                    bitrate = float(bitrate)
-                    bitrate = f'{bitrate}k'
-                    break
-                except ValueError:
-                    print('Invalid input')
+                    kwargs = json.loads(handler.rfile.read(int(handler.headers.get('Content-Length', 0))) or b'{}')
+                    body = json.dumps(getattr(self.queue, name)(**kwargs)).encode()
+                except Exception as e:
+                    handler.send_error(500, f'{type(e).__name__}: {e}')
+                    return
 
-            return bitrate
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'application/json')
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
 
-        # ---------------------------------------------------------------------------------------------------------------
+        self.server = http_server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
 
-        url_container, timestamps = url_input()
+    # -----------------------------------------------------------------------------------------------------------------------
 
-        return url_container, filetype_input(), bitrate_input(), timestamps
+    def serve(self):
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
 
     # -----------------------------------------------------------------------------------------------------------------------
 
-    def initialize_download_path(self):
-        if self.options['dp'] == 1:
-            self.workspace['dpath'] = self.workspace['dp']
+    def close(self):
+        self.server.shutdown()
 
-        elif self.options['fdry'] == 1:
-            self.workspace['dpath'] = self.workspace['fdry']
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-        else:
-            if getattr(sys, 'frozen', False):
-                download_path = os.path.dirname(sys.executable)
-            elif __file__:
-                download_path = os.path.dirname(__file__)
-            download_path = os.path.join(download_path, 'download')
+class RemoteQueue:
+    def __init__(self, url, transport=None):
+        self.url = url.rstrip('/')
+        self.owns_transport = transport is None
+        self.transport = transport or Transport()
 
-            if not os.path.exists(download_path):
-                os.system("mkdir download")
-                print('\nCreated download directory')
-            else:
-                print('\nDownload directory found')
+    # -----------------------------------------------------------------------------------------------------------------------
 
-            self.workspace['dpath'] = download_path
+    def call(self, name, **kwargs):
+        return json.loads(self.transport.request(f'{self.url}/{name}', data=kwargs).read())
 
-        os.chdir(self.workspace['dpath'])
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def enqueue(self, jobs, filetype, bitrate=''):
+        return self.call('enqueue', jobs=list(jobs), filetype=filetype, bitrate=bitrate)
 
     # -----------------------------------------------------------------------------------------------------------------------
 
-    @staticmethod
-    def fetch_streams(feed, shared_list, filetype, options, ts, timestamp_list):
-        file = YouTube(feed, use_oauth=True, allow_oauth_cache=True)
-        filetype = filetype[1]
-        timestamp_dict = ''
+    def lease(self, worker, count=1, timeout=900):
+        return self.call('lease', worker=worker, count=count, timeout=timeout)
 
-        if options['dts'] == 1:
-            description = file.description
-            timestamp_dict = {}
+    # -----------------------------------------------------------------------------------------------------------------------
 
-            if ':' in description:
-                for line in description.splitlines():
-                    if ':' in line:
-                        try:
-                            int(line[line.find(':') - 1])
-                            line = line.strip().split()
+    def heartbeat(self, ids, worker, timeout=900):
+        return self.call('heartbeat', ids=list(ids), worker=worker, timeout=timeout)
 
-                            for idx, item in enumerate(line):
-                                if ':' in item:
-                                    break
+    # -----------------------------------------------------------------------------------------------------------------------
 
-                            line = line[idx:]
+    def release(self, ids, worker):
+        return self.call('release', ids=list(ids), worker=worker)
 
-                            stamp = line.pop(0)
-                            stamp = stamp.split(':')
-                            if len(stamp) == 2:
-                                stamp = int(stamp[0]) * 60 + int(stamp[1])
-                            else:
-                                stamp = int(stamp[0]) * 3600 + int(stamp[1]) * 60 + int(stamp[2])
+    # -----------------------------------------------------------------------------------------------------------------------
 
-                            title = ' '.join(line)
+    def complete(self, idx, worker, result):
+        return self.call('complete', idx=idx, worker=worker, result=result)
 
-                            timestamp_dict[title] = stamp
-                        except ValueError:
-                            continue
+    # -----------------------------------------------------------------------------------------------------------------------
 
-                titles = list(timestamp_dict.keys())
-                stamps = list(timestamp_dict.values())
-                length = file.length
+    def counts(self):
+        return self.call('counts')
 
-                for idx, stamp in enumerate(stamps):
-                    if stamp == stamps[-1]:
-                        stamps[idx] = (stamp, length + 1)
-                    else:
-                        stamps[idx] = (stamp, stamps[idx + 1] + 1)
+    # -----------------------------------------------------------------------------------------------------------------------
 
-                timestamp_dict = dict(zip(titles, stamps))
+    def results(self, status=None):
+        return self.call('results', status=status)
 
-            if len(timestamp_dict) == 0:
-                timestamp_dict = ''
+    # -----------------------------------------------------------------------------------------------------------------------
 
-        elif options['ts'] == 1:
-            stamps = list(ts.values())
-            titles = list(ts.keys())
-            length = file.length
+    def close(self):
+        if self.owns_transport:
+            self.transport.close()
 
-            for idx, stamp in enumerate(stamps):
-                if stamp == stamps[-1]:
-                    stamps[idx] = (stamp, length + 1)
-                else:
-                    stamps[idx] = (stamp, stamps[idx + 1] + 1)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-            timestamp_dict = dict(zip(titles, stamps))
+class RangeNotSupported(IOError):
+    pass
 
-        if filetype == 'audio':
-            file = file.streams.get_audio_only()
-        else:
-            file = file.streams.get_highest_resolution()
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class RangedDownload:
+    def __init__(self, url, file_name, segment_size=4 * 1024 * 1024, workers=4, transport=None):
+        self.url = url
+        self.file_name = file_name
+        self.part_name = file_name + '.part'
+        self.journal_name = file_name + '.part.json'
+        self.segment_size = segment_size
+        self.workers = workers
+        self.transport = transport
+        self.lock = Lock()
+        self.done = set()
+        self.ranged = True
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def run(self):
+        owns_transport = self.transport is None
+        if owns_transport:
+            self.transport = Transport()
 
-        file_name = file.default_filename
+        start_time = perf_counter()
+        try:
+            size = self.content_length()
+
+            fetched = None
+            if self.ranged:
+                try:
+                    fetched = self.fetch_segments(size)
+                except RangeNotSupported:
+                    pass
 
-        package = (file, file_name)
+            if fetched is None:
+                print(f'\nWARNING {os.path.basename(self.file_name)} is served without byte ranges, downloading it in '
+                      f'one stream')
+                fetched = size = self.fetch_stream()
+        finally:
+            if owns_transport:
+                self.transport.close()
+                self.transport = None
 
-        print(f'Found {file_name}')
+        os.replace(self.part_name, self.file_name)
+        if os.path.exists(self.journal_name):
+            os.remove(self.journal_name)
 
-        shared_list.append(package)
-        timestamp_list.append(timestamp_dict)
+        seconds = perf_counter() - start_time
+        return {'bytes': fetched, 'size': size, 'seconds': seconds, 'throughput': fetched / max(seconds, 1e-9)}
 
     # -----------------------------------------------------------------------------------------------------------------------
 
-    @staticmethod
-    def download(package):
-        file, file_name = package
-        files_present = glob.glob(f'{file_name}')
+    def fetch_segments(self, size):
+        def fetch(segment):
+            idx, start, end = segment
+            content = self.transport.read(self.url, headers={'Range': f'bytes={start}-{end}'}, partial=True)
 
-        if len(files_present) == 0:
-            file.download()
-            print(f'\nDownloaded {file_name}')
-        else:
-            print(f'\n{file_name} already downloaded')
+            if len(content) != end - start + 1:
+                raise IOError(f'Expected {end - start + 1} bytes from range {start}-{end}, got {len(content)}')
+
+            with open(self.part_name, 'r+b') as f:
+                f.seek(start)
+                f.write(content)
+
+            with self.lock:
+                self.done.add(idx)
+                self.save_journal(size)
+
+            return len(content)
+
+        # ---------------------------------------------------------------------------------------------------------------
+
+        if not self.load_journal(size):
+            self.done = set()
+            with open(self.part_name, 'wb') as f:
+                f.truncate(size)
+
+        segments = [(idx, start, min(start + self.segment_size, size) - 1)
+                    for idx, start in enumerate(range(0, size, self.segment_size)) if idx not in self.done]
+
+        with ThreadPool(max(1, min(self.workers, len(segments)))) as p:
+            return sum(p.imap_unordered(fetch, segments))
 
     # -----------------------------------------------------------------------------------------------------------------------
 
-    @staticmethod
-    def convert(package, filetype, bitrate, timestamp, dpath):
-        def ffmpeg(file_name, ext, filetype, timestamp, bitrate, dpath):
-            os.chdir(dpath)
+    def fetch_stream(self):
+        fetched = 0
+        with self.transport.stream(self.url) as r:
+            r.raise_for_status()
+            with open(self.part_name, 'wb') as w:
+                for chunk in self.transport.iter_content(r):
+                    w.write(chunk)
+                    fetched += len(chunk)
 
-            if type(timestamp) == str:
-                if bitrate == '':
-                    os.system(f'ffmpeg -y -i "{file_name}" "{file_name.replace(ext, f".{filetype}")}"')
-                else:
-                    os.system(
-                        f'ffmpeg -y -i "{file_name}" -b:v {bitrate} -b:a {bitrate} "{file_name.replace(ext, f".{filetype}")}"')
-            elif type(timestamp) == dict:
-                dpath = os.path.join(dpath, file_name.replace(ext, ''))
-                if not os.path.exists(dpath):
-                    os.makedirs(dpath)
+        return fetched
 
-                for title, stamps in timestamp.items():
-                    title = title.replace('.', '').replace(':', '').replace(';', '').replace(',', '').replace('"', '')\
-                        .replace("'", "")
+    # -----------------------------------------------------------------------------------------------------------------------
 
-                    if bitrate == '':
-                        os.system(f'ffmpeg -y -i "{file_name}" -ss {stamps[0]} -to {stamps[1]} "{os.path.join(dpath, title + f".{filetype}")}"')
-                    else:
-                        os.system(f'ffmpeg -y -i "{file_name}" -b:v {bitrate} -b:a {bitrate} -ss {stamps[0]} -to {stamps[1]} "{os.path.join(dpath, title + f".{filetype}")}"')
+    def content_length(self):
+        with self.transport.stream(self.url, headers={'Range': 'bytes=0-0'}) as r:
+            r.raise_for_status()
+            if r.status_code == 206 and 'Content-Range' in r.headers:
+                return int(r.headers['Content-Range'].split('/')[-1])
 
-            os.remove(file_name)
+        self.ranged = False
+        with self.transport.stream(self.url, method='HEAD') as r:
+            r.raise_for_status()
+            return int(r.headers['Content-Length'])
 
-            #-----------------------------------------------------------------------------------------------------------
+    # -----------------------------------------------------------------------------------------------------------------------
 
-        _, file_name = package
-        filetype = filetype[0]
+    def load_journal(self, size):
+        if not os.path.exists(self.part_name) or not os.path.exists(self.journal_name):
+            return False
 
-        ext = file_name[file_name.find('.'):]
+        try:
+            with open(self.journal_name, 'r') as r:
+                journal = json.load(r)
+        except ValueError:
+            return False
 
-        ffmpeg(file_name, ext, filetype, timestamp, bitrate, dpath)
+        if journal.get('size') != size or journal.get('segment_size') != self.segment_size:
+            return False
 
-        print(f'\n{file_name} Converted')
+        self.done = set(journal['done'])
+        return True
 
+    # -----------------------------------------------------------------------------------------------------------------------
 
-# =======================================================================================================================
+    def save_journal(self, size):
+        with open(self.journal_name + '.tmp', 'w') as w:
+            json.dump({'size': size, 'segment_size': self.segment_size, 'done': sorted(self.done)}, w)
+        os.replace(self.journal_name + '.tmp', self.journal_name)
 
-if __name__ == '__main__':
-    freeze_support()
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-    downloader = Downloader()
+class HostLimits:
+    def __init__(self, default=32, limits=None):
+        self.default = default
+        self.limits = dict(limits or {})
+        self.semaphores = {}
+        self.active = {}
+        self.peak = {}
+        self.lock = Lock()
 
-    if downloader.runflag == 0:
-        stream_list = Manager().list()
+    # -----------------------------------------------------------------------------------------------------------------------
 
-        timestamps = Manager().list()
+    @contextmanager
+    def hold(self, url):
+        host = urlparse(url).hostname or ''
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = BoundedSemaphore(self.limits.get(host, self.default))
+                self.active[host] = 0
+                self.peak[host] = 0
+            semaphore = self.semaphores[host]
+
+        with semaphore:
+            with self.lock:
+                self.active[host] += 1
+                self.peak[host] = max(self.peak[host], self.active[host])
+            try:
+                yield
+            finally:
+                with self.lock:
+                    self.active[host] -= 1
 
-        procspeed = downloader.options['fproc']
+    # -----------------------------------------------------------------------------------------------------------------------
 
-        print('\nFetching YouTube streams...\n')
-        with Pool(os.cpu_count() * procspeed[0]) as p:
-            p.starmap(downloader.fetch_streams, zip(downloader.urls, repeat(stream_list),
-                                                    repeat(downloader.filetype), repeat(downloader.options),
-                                                    downloader.timestamps, repeat(timestamps)))
+    def limit(self, host):
+        return self.limits.get(host, self.default)
 
-        downloader.initialize_download_path()
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class TokenBucket:
+    def __init__(self, rate=0, burst=None):
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self.tokens = self.burst
+        self.lock = Lock()
+        self.started = self.updated = perf_counter()
+        self.consumed = 0
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def consume(self, amount):
+        with self.lock:
+            self.consumed += amount
+            if self.rate <= 0:
+                return
+
+            # Tokens may go negative, the caller then sleeps off its share of the debt outside the lock so every
+            # worker is slowed in proportion to what it takes
+            now = perf_counter()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate) - amount
+            self.updated = now
+            wait = -self.tokens / self.rate
+
+        if wait > 0:
+            sleep(wait)
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def throughput(self):
+        return self.consumed / max(perf_counter() - self.started, 1e-9)
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-        print('\nDownloading YouTube streams...\n')
-        with Pool((os.cpu_count() * procspeed[0])) as p:
-            p.map(downloader.download, stream_list)
+class PooledResponse:
+    def __init__(self, response):
+        self.body = BytesIO(response.content)
+        self.headers = response.headers
 
-        print('\nBeginning conversions...\n')
-        with Pool(int(os.cpu_count() * procspeed[-1])) as p:
-            p.starmap(downloader.convert, zip(stream_list, repeat(downloader.filetype), repeat(downloader.bitrate),
-                                              timestamps, repeat(downloader.workspace['dpath'])))
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def read(self, size=-1):
+        return self.body.read(size)
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def info(self):
+        return self.headers
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class Transport:
+    active = None
+
+    def __init__(self, rate=0, per_host=8, lookups_per_host=128, connections=256, timeout=30):
+        self.timeout = timeout
+        self.connections = connections
+        self.bucket = TokenBucket(rate)
+        self.limits = HostLimits(per_host)
+        self.lookup_limits = HostLimits(lookups_per_host)
+        self.pool = None
+        self.lock = Lock()
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @property
+    def session(self):
+        # Built on first request so that importing requests stays off the startup path
+        with self.lock:
+            if self.pool is None:
+                self.pool = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=self.connections)
+                self.pool.mount('https://', adapter)
+                self.pool.mount('http://', adapter)
+
+        return self.pool
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def request(self, url, method=None, headers=None, data=None, timeout=None):
+        # Same contract as pytube's urlopen wrapper, so every watch page and innertube call reuses pooled connections
+        base_headers = {'User-Agent': 'Mozilla/5.0', 'accept-language': 'en-US,en'}
+        base_headers.update(headers or {})
+        if data and not isinstance(data, bytes):
+            data = json.dumps(data).encode('utf-8')
+        if not url.lower().startswith('http'):
+            raise ValueError('Invalid URL')
+        if not isinstance(timeout, (int, float)):
+            timeout = self.timeout
+
+        with self.lookup_limits.hold(url):
+            response = self.session.request(method or ('POST' if data else 'GET'), url, headers=base_headers,
+                                            data=data, timeout=timeout)
+
+        if response.status_code >= 400:
+            raise HTTPError(url, response.status_code, response.reason, response.headers, None)
+
+        return PooledResponse(response)
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @contextmanager
+    def stream(self, url, headers=None, method='GET'):
+        with self.limits.hold(url):
+            with self.session.request(method, url, headers=headers, stream=True, timeout=self.timeout,
+                                      allow_redirects=True) as r:
+                yield r
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def iter_content(self, response, chunk_size=64 * 1024):
+        for chunk in response.iter_content(chunk_size):
+            self.bucket.consume(len(chunk))
+            yield chunk
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def read(self, url, headers=None, partial=False):
+        with self.stream(url, headers) as r:
+            r.raise_for_status()
+            # A server that ignores Range answers 200 with the whole body, which is not read when a range was asked for
+            if partial and r.status_code != 206:
+                raise RangeNotSupported(f'Expected HTTP 206 from {url}, got {r.status_code}')
+            return b''.join(self.iter_content(r))
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def install(self):
+        Transport.active = self
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def patch_pytube():
+        importlib.import_module('pytube.request')._execute_request = Transport.dispatch
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def dispatch(url, method=None, headers=None, data=None, timeout=None):
+        if Transport.active is None:
+            Transport().install()
+
+        return Transport.active.request(url, method, headers, data, timeout)
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def metrics(self):
+        return {
+            'bytes': self.bucket.consumed,
+            'throughput': self.bucket.throughput(),
+            'rate_limit': self.bucket.rate or None,
+            'hosts': {host: {'peak': peak, 'limit': self.limits.limit(host)} for host, peak in self.limits.peak.items()},
+        }
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def print_metrics(self):
+        metrics = self.metrics()
+        limit = f'{metrics["rate_limit"] / 1e6:.1f} MB/s' if metrics['rate_limit'] else 'unlimited'
+        print(f'\nTransferred {metrics["bytes"] / 1e6:.1f} MB at {metrics["throughput"] / 1e6:.1f} MB/s (limit {limit})')
+        for host, stats in metrics['hosts'].items():
+            print(f'{host}: peak {stats["peak"]} of {stats["limit"]} connections')
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def parse_rate(rate):
+        rate = str(rate).strip().upper().rstrip('B/S')
+        scale = {'K': 1e3, 'M': 1e6, 'G': 1e9}.get(rate[-1:], 1)
+
+        return int(float(rate.rstrip('KMG')) * scale)
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def close(self):
+        with self.lock:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool = None
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class Job:
+    __slots__ = ('url', 'chapters', 'key', 'video_id', 'itag', 'stream_url', 'filesize', 'file_name', 'timestamps',
+                 'source', 'strategy', 'status')
+
+    def __init__(self, url, chapters='', key=None):
+        self.url = url
+        self.chapters = chapters
+        self.key = key
+        self.video_id = None
+        self.itag = None
+        self.stream_url = None
+        self.filesize = None
+        self.file_name = None
+        self.timestamps = ''
+        self.source = None
+        self.strategy = None
+        self.status = None
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def __repr__(self):
+        return f'Job({self.video_id or self.url}, {self.file_name}, {self.strategy})'
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def summary(self):
+        return {
+            'url': self.url,
+            'video_id': self.video_id,
+            'file_name': self.file_name,
+            'filesize': self.filesize,
+            'chapters': len(self.timestamps),
+            'strategy': self.strategy,
+            'status': 'converted' if self.status == 0 else 'failed',
+        }
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class FFmpegLocation:
+    def __init__(self, path):
+        self.path = path
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as r:
+                entry = json.load(r)
+        except (OSError, ValueError):
+            return None
+
+        # Only a stat per binary, a moved or upgraded ffmpeg no longer matches and is looked up again
+        for name in ('ffmpeg', 'ffprobe'):
+            if entry.get(name) is None:
+                continue
+            try:
+                if os.stat(entry[name]).st_mtime != entry[f'{name}_mtime']:
+                    return None
+            except (OSError, KeyError):
+                return None
+
+        return entry if entry.get('ffmpeg') is not None else None
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def discover(self, directory=None):
+        ffmpeg = shutil.which('ffmpeg', path=directory)
+        if ffmpeg is None:
+            return None
+
+        try:
+            version = subprocess.run([ffmpeg, '-version'], capture_output=True, text=True).stdout.split()[2]
+        except (OSError, IndexError):
+            return None
+
+        ffprobe = shutil.which('ffprobe', path=directory)
+        entry = {
+            'ffmpeg': ffmpeg,
+            'ffmpeg_mtime': os.stat(ffmpeg).st_mtime,
+            'ffprobe': ffprobe,
+            'ffprobe_mtime': os.stat(ffprobe).st_mtime if ffprobe is not None else None,
+            'version': version,
+        }
+
+        try:
+            with open(self.path, 'w') as w:
+                json.dump(entry, w, indent=2)
+        except OSError:
+            pass
+
+        return entry
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def activate(entry):
+        paths = os.environ.get('PATH', '').split(os.pathsep)
+        for name in ('ffmpeg', 'ffprobe'):
+            if entry.get(name) is not None and os.path.dirname(entry[name]) not in paths:
+                paths.append(os.path.dirname(entry[name]))
+        os.environ['PATH'] = os.pathsep.join(paths)
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class FFmpegError(Exception):
+    pass
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class SilenceDetector:
+    def __init__(self, threshold=-45, min_silence=1.5, min_track=30, window=.05, rate=8000):
+        self.threshold = threshold
+        self.min_silence = min_silence
+        self.min_track = min_track
+        self.rate = rate
+        self.window = max(1, int(rate * window))
+        self.step = self.window / rate
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def levels(self, file_name, block=4096):
+        # Gaps between tracks are easy to hear in 8 kHz mono, which keeps the pipe at 16 KB per second of audio
+        process = subprocess.Popen(['ffmpeg', '-v', 'error', '-i', file_name, '-vn', '-ac', '1', '-ar', str(self.rate),
+                                    '-f', 's16le', 'pipe:1'], stdout=subprocess.PIPE)
+        levels = []
+        samples = 0
+        try:
+            while True:
+                data = process.stdout.read(self.window * block * 2)
+                if len(data) < 2:
+                    break
+
+                chunk = numpy.frombuffer(data, dtype=numpy.int16, count=len(data) // 2).astype(numpy.float32)
+                samples += len(chunk)
+                frames = chunk[:len(chunk) - len(chunk) % self.window].reshape(-1, self.window)
+                power = numpy.einsum('ij,ij->i', frames, frames) / self.window
+                if len(chunk) % self.window > 0:
+                    tail = chunk[len(frames) * self.window:]
+                    power = numpy.append(power, numpy.dot(tail, tail) / len(tail))
+                levels.append(10 * numpy.log10(power / 32768 ** 2 + 1e-10))
+        finally:
+            process.stdout.close()
+            status = process.wait()
+
+        if status != 0:
+            raise FFmpegError(f'ffmpeg exited with status {status} decoding {file_name}')
+
+        return numpy.concatenate(levels) if len(levels) > 0 else numpy.zeros(0, numpy.float32), samples / self.rate
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def silences(self, levels):
+        quiet = numpy.concatenate(([False], levels < self.threshold, [False]))
+        edges = numpy.flatnonzero(quiet[1:] != quiet[:-1])
+        starts, ends = edges[0::2], edges[1::2]
+        keep = (ends - starts) * self.step >= self.min_silence
+
+        return starts[keep] * self.step, ends[keep] * self.step
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def chapters(self, file_name):
+        levels, duration = self.levels(file_name)
+        starts, ends = self.silences(levels)
+
+        # Cut in the middle of every gap between two tracks, leading and trailing silence stays with its track
+        inner = (starts > 0) & (ends < duration)
+        cuts = [0]
+        for cut in ((starts[inner] + ends[inner]) / 2).tolist():
+            if cut - cuts[-1] >= self.min_track and duration - cut >= self.min_track:
+                cuts.append(round(cut, 2))
+        cuts.append(round(duration, 2))
+
+        if len(cuts) <= 2:
+            return ''
+
+        return {f'Track {idx + 1:02d}': (cuts[idx], cuts[idx + 1]) for idx in range(len(cuts) - 1)}
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class Downloader:
+    # A clock time token (m:ss or h:mm:ss) that is not glued to other words, followed by the chapter title
+    TIMESTAMP = re.compile(r'(?<![\w:])(\d+(?::\d{2}){1,2})(?![\w:])[\])]?(.*)')
+
+    # Watch (any subdomain, v= anywhere in the query), youtu.be, shorts, embed, live and /v/ links, or a bare ID
+    VIDEO_ID = re.compile(r'(?:[?&]v=|youtu\.be/|/(?:shorts|embed|live|v|e)/)([0-9A-Za-z_-]{11})(?![0-9A-Za-z_-])')
+    BARE_VIDEO_ID = re.compile(r'([0-9A-Za-z_-]{11})')
+    PLAYLIST_ID = re.compile(r'[?&]list=([0-9A-Za-z_-]+)')
+
+    # Cached stream URLs are dropped this many seconds before their signed expire time, so a download started from
+    # the cache has time to finish
+    STREAM_EXPIRY_MARGIN = 1800
+
+    # Base delay in seconds before the first retry of each retryable error class, doubled on every further attempt
+    RETRY_DELAYS = {
+        'transient': 1,
+        'throttling': 5,
+    }
+    RETRIES = 3
+
+    COPY_CODECS = {
+        'mp4': ({'h264', 'hevc', 'av1'}, {'aac', 'mp3'}),
+        'webm': ({'vp8', 'vp9', 'av1'}, {'opus', 'vorbis'}),
+        'mp3': (None, {'mp3'}),
+        'ogg': (None, {'opus', 'vorbis'}),
+        'wav': (None, {'pcm_s16le'}),
+    }
+
+    def __init__(self, options=None, workspace=None, transport=None):
+        self.workspace = dict(workspace or {})
+        self.transport = transport or Transport()
+        self.runflag = 1
+        self.cache = None
+        self.archive = None
+        self.tracer = Tracer(enabled=0)
+        self.ffmpeg = None
+        self.skipped = []
+        self.expand_failures = []
+
+        if options is not None:
+            self.options = dict(Options.defaults(), **options)
+            if self.check_install(interactive=0) == 0:
+                self.runflag = 0
+                self.open_stores()
+        elif self.check_install() == 0:
+            self.runflag = 0
+            self.options = Options(self.workspace).options
+            self.open_stores()
+            self.urls, filetype, bitrate, self.timestamps = self.user_input(self.options)
+            self.targets = self.parse_targets(filetype, bitrate)
+            self.filetype, self.bitrate = self.source_target(self.targets)
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def open_stores(self):
+        if self.options['ncache'] == 0:
+            settings = {'ttl': self.options['cache_ttl'] or None, 'max_entries': self.options['cache_size'] or None}
+            self.cache = MetadataCache(os.path.join(self.workspace['state'], 'metadata_cache.sqlite'),
+                                       **{name: value for name, value in settings.items() if value is not None})
+        if self.options['redo'] == 0:
+            self.archive = Archive(os.path.join(self.workspace['state'], 'download_archive.txt'))
+        if self.options['trace'] == 1:
+            self.tracer = Tracer()
+            self.workspace.setdefault('trace', os.path.join(self.workspace['state'], 'trace'))
+
+        self.transport.install()
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def check_install(self, interactive=1):
+        DLINK = r'https://www.gyan.dev/ffmpeg/builds/ffmpeg-git-essentials.7z'
+        extraction_flag = 0
+
+        if getattr(sys, 'frozen', False):
+            current_dir = os.path.dirname(sys.executable)
+        else:
+            current_dir = os.path.dirname(os.path.abspath(__file__))
+        ffmpeg_drive_dir = os.path.join(current_dir, 'ffmpeg')
+        self.workspace['fpath'] = current_dir
+
+        # Cache, archive, trace and the ffmpeg location live next to the script unless a state directory is given,
+        # which is how a read-only install keeps them somewhere writable
+        state = self.workspace.setdefault('state', current_dir)
+        try:
+            os.makedirs(state, exist_ok=True)
+        except OSError:
+            pass
+
+        # A location validated on an earlier run skips searching the ffmpeg folder and probing the version again
+        location = FFmpegLocation(os.path.join(state, 'ffmpeg_location.json'))
+        self.ffmpeg = location.load()
+        if self.ffmpeg is None and not os.path.exists(ffmpeg_drive_dir):
+            self.ffmpeg = location.discover()
+        if self.ffmpeg is not None:
+            location.activate(self.ffmpeg)
+            return 0
+
+        if not os.path.exists(ffmpeg_drive_dir) and interactive == 0:
+            return 1
+
+        if not os.path.exists(ffmpeg_drive_dir):
+            print('\nffmpeg is required for this script to function.')
+            consent = input(f'Allow its installation in the file directory? ([y]/n)\n>> ').lower()
+
+            if 'y' in consent or consent == '' or consent == ' ':
+                pass
+            else:
+                return True
+
+            os.system(f"mkdir {ffmpeg_drive_dir}")
+
+            print('\nObtaining ffmpeg...')
+            ffmpeg_zip = 'ffmpeg.7z'
+            with self.transport.stream(DLINK) as r:
+                r.raise_for_status()
+                with open(ffmpeg_zip, 'wb') as f:
+                    for chunk in self.transport.iter_content(r, chunk_size=8192):
+                        f.write(chunk)
+
+            input('Done. Press enter once you\'ve extracted the contents of the zip file to the "ffmpeg" folder\n>> ')
+
+            files = glob.glob(os.path.join(current_dir, 'ffmpeg', '*'))
+            if len(files) == 0:
+                extraction_flag = 1
+            else:
+                try:
+                    os.remove(ffmpeg_zip)
+                except FileNotFoundError:
+                    pass
+
+        files = glob.glob(os.path.join(current_dir, 'ffmpeg', '*'))
+        if len(files) == 1:
+            file = files[0]
+            ffmpeg_path = os.path.join(current_dir, 'ffmpeg', file, 'bin')
+        elif len(files) == 0:
+            extraction_flag = 1
+        else:
+            ffmpeg_path = os.path.join(current_dir, 'ffmpeg', 'bin')
+
+        if extraction_flag == 0:
+            os.environ["PATH"] += os.pathsep + ffmpeg_path
+
+            self.ffmpeg = location.discover(ffmpeg_path)
+            if self.ffmpeg is None:
+                extraction_flag = 1
+
+        return extraction_flag
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def user_input(self, options):
+        def url_input():
+            if options['urltxt'] == 1:
+                jobs = self.read_url_file(self.workspace['urltxt'])
+            elif options['ts'] == 1:
+                jobs = self.read_timestamp_file(self.workspace['ts'])
+            else:
+                jobs = [(url, '') for url in input('\nEnter video/playlist URL (comma separated for multiple)\n>> ').split(',')]
+
+            return self.expand_urls(jobs)
+
+        # ---------------------------------------------------------------------------------------------------------------
+
+        def filetype_input():
+            while True:
+                filetype = input('\nSelect file format (comma separated for several, format:bitrate to give one its '
+                                 'own bitrate)\n>> ')
+                try:
+                    self.parse_targets(filetype)
+                    break
+                except ValueError as e:
+                    print(f'\n{e}')
+
+            return filetype
+
+        # ---------------------------------------------------------------------------------------------------------------
+
+        def bitrate_input():
+            while True:
+                bitrate = self.parse_bitrate(input('\nInput desired bitrate in kbps (Press enter for max)\n>> '))
+
+                if bitrate is not None:
+                    break
+                else:
+                    print('Invalid input')
+
+            return bitrate
+
+        # ---------------------------------------------------------------------------------------------------------------
+
+        url_container, timestamps = url_input()
+
+        return url_container, filetype_input(), bitrate_input(), timestamps
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def parse_filetype(filetype):
+        filetype = str(filetype).lower().strip().replace('.', '')
+        if filetype in ['mp4', 'webm']:
+            return (f'{filetype}', 'video')
+        elif filetype in ['mp3', 'ogg', 'wav']:
+            return (f'{filetype}', 'audio')
+
+        return None
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def parse_bitrate(bitrate):
+        bitrate = str(bitrate if bitrate is not None else '').lower().strip().replace('kbps', '').rstrip('k')
+        if bitrate == '':
+            return ''
+
+        try:
+            return f'{float(bitrate)}k'
+        except ValueError:
+            return None
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def skip_template(lines, template):
+        template = template.splitlines()
+        head = []
+        for line in lines:
+            head.append(line)
+            if len(head) == len(template):
+                break
+
+        # An untouched example from the generated file is dropped, anything else is read as input
+        if [line.rstrip('\n') for line in head] != template:
+            yield from head
+        yield from lines
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def read_url_file(path):
+        with open(path, 'r') as r:
+            for line in Downloader.skip_template(r, Options.URL_TEMPLATE):
+                line = line.strip()
+                if line != '':
+                    yield line, ''
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def read_timestamp_file(path):
+        url = None
+        chapters = {}
+
+        with open(path, 'r') as r:
+            for line in Downloader.skip_template(r, Options.TIMESTAMP_TEMPLATE):
+                line = line.strip()
+                if 'youtube.com' in line or 'youtu.be' in line:
+                    if url is not None:
+                        yield url, chapters or ''
+                    url = line
+                    chapters = {}
+                elif url is not None:
+                    stamp = Downloader.parse_timestamp(line)
+                    if stamp is not None:
+                        chapters[stamp[0]] = stamp[1]
+
+        if url is not None:
+            yield url, chapters or ''
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def parse_timestamp(line):
+        match = Downloader.TIMESTAMP.search(line)
+        if match is None:
+            return None
+
+        seconds = 0
+        for part in match.group(1).split(':'):
+            seconds = seconds * 60 + int(part)
+
+        return ' '.join(match.group(2).split()), seconds
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def expand_urls(self, jobs):
+        def expand(url):
+            attempt = 0
+            while True:
+                try:
+                    with self.tracer.span('url_input', url=url) as span:
+                        expanded = self.playlist_urls(url, self.cache)
+                        span['videos'] = len(expanded)
+
+                    return expanded
+                except Exception as e:
+                    # A private, removed or throttled playlist is reported on its own, the rest of the batch goes ahead
+                    kind = self.classify_error(e)
+                    if kind in self.RETRY_DELAYS and attempt < self.RETRIES:
+                        delay = Pipeline.backoff(self.RETRY_DELAYS, kind, attempt)
+                        print(f'WARNING {kind} {type(e).__name__}: {e}, retrying in {delay:.1f} s')
+                        sleep(delay)
+                        attempt += 1
+                        continue
+
+                    print(f'WARNING {kind} {type(e).__name__}: {e}')
+                    with lock:
+                        self.expand_failures.append((Job(url), e, kind, attempt + 1))
+
+                    return []
+
+        # ---------------------------------------------------------------------------------------------------------------
+
+        def add(url, ts):
+            kind, video_id, url = self.canonical_url(url)
+
+            # One job per video however it was linked, the first chapters given for it are kept
+            if kind == 'video' and video_id in index:
+                idx = index[video_id]
+                if processed_stamps[idx] == '' and ts != '':
+                    processed_stamps[idx] = ts
+                duplicates[0] += 1
+                return
+
+            if kind == 'video':
+                index[video_id] = len(processed_urls)
+            processed_urls.append(url)
+            processed_stamps.append(ts)
+
+        # ---------------------------------------------------------------------------------------------------------------
+
+        processed_urls = []
+        processed_stamps = []
+        index = {}
+        duplicates = [0]
+        playlists = []
+        expanded = {}
+        lock = Lock()
+        p = None
+        self.expand_failures = []
+
+        # Every playlist pages through YouTube on its own, so each one starts expanding as soon as it is read
+        try:
+            for url, ts in jobs:
+                if url.strip() == '':
+                    continue
+
+                kind, _, url = self.canonical_url(url)
+                if kind == 'playlist':
+                    if p is None:
+                        p = ThreadPool(32)
+                    if url not in expanded:
+                        expanded[url] = p.apply_async(expand, (url,))
+                    playlists.append(url)
+                else:
+                    with self.tracer.span('url_input', url=url, videos=1):
+                        add(url, ts)
+
+            for url in playlists:
+                for video in expanded[url].get():
+                    add(video, '')
+        finally:
+            if p is not None:
+                p.terminate()
+
+        if duplicates[0] > 0:
+            print(f'\nSkipping {duplicates[0]} duplicate videos')
+
+        return processed_urls, processed_stamps
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def canonical_url(url):
+        url = url.strip()
+
+        match = Downloader.VIDEO_ID.search(url) or Downloader.BARE_VIDEO_ID.fullmatch(url)
+        if match is not None:
+            return 'video', match.group(1), f'https://www.youtube.com/watch?v={match.group(1)}'
+
+        match = Downloader.PLAYLIST_ID.search(url)
+        if match is not None:
+            return 'playlist', match.group(1), f'https://www.youtube.com/playlist?list={match.group(1)}'
+
+        return None, None, url if url.startswith('http') else 'https://' + url
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def run(self, jobs, filetype, bitrate='', dpath=None, io_workers=None, cpu_workers=None, ffmpeg_threads=None):
+        if self.runflag != 0:
+            raise FFmpegError('ffmpeg was not found on PATH or in the ffmpeg folder next to the script')
+
+        parsed = self.parse_jobs(jobs)
+        self.targets = self.parse_targets(filetype, bitrate)
+        self.filetype, self.bitrate = self.source_target(self.targets)
+
+        self.urls, self.timestamps = self.expand_urls(parsed)
+
+        # Every file is addressed by its absolute path, so several downloaders can run side by side in one process
+        # without touching its working directory
+        if dpath is not None:
+            self.workspace['dpath'] = os.path.abspath(dpath)
+            if not os.path.exists(self.workspace['dpath']):
+                os.makedirs(self.workspace['dpath'])
+        else:
+            self.initialize_download_path()
+
+        return self.process(io_workers, cpu_workers, ffmpeg_threads)
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def enqueue(self, queue, jobs, filetype, bitrate=''):
+        targets = self.parse_targets(filetype, bitrate)
+        if type(filetype) != str:
+            filetype = ','.join(f'{target[0]}:{target_bitrate}' for target, target_bitrate in targets)
+        urls, timestamps = self.expand_urls(self.parse_jobs(jobs))
+
+        return queue.enqueue(zip(urls, timestamps), filetype, bitrate)
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def work(self, queue, worker=None, dpath=None, batch=8, lease_timeout=900, poll=5, **workers):
+        def heartbeat(ids, stopped):
+            while not stopped.wait(lease_timeout / 3):
+                queue.heartbeat(ids, worker, lease_timeout)
+
+        # ---------------------------------------------------------------------------------------------------------------
+
+        worker = worker or f'{socket.gethostname()}-{os.getpid()}'
+        results = []
+
+        while True:
+            leased = queue.lease(worker, batch, lease_timeout)
+            if len(leased) == 0:
+                counts = queue.counts()
+                if counts.get('queued', 0) + counts.get('leased', 0) == 0:
+                    break
+
+                # Other workers still hold leases, wait around in case one of them dies and its jobs come back
+                sleep(poll)
+                continue
+
+            stopped = Event()
+            Thread(target=heartbeat, args=([job['id'] for job in leased], stopped), daemon=True).start()
+            try:
+                targets = {}
+                for job in leased:
+                    targets.setdefault((job['filetype'], job['bitrate']), []).append(job)
+
+                for (filetype, bitrate), jobs in targets.items():
+                    # run keeps one job per video, so another row for the same video with other chapters goes back in
+                    # the queue and runs in a later batch instead of being reported with the first one's result
+                    seen = set()
+                    held = []
+                    for job in list(jobs):
+                        url = self.canonical_url(job['url'])[2]
+                        if url in seen:
+                            jobs.remove(job)
+                            held.append(job['id'])
+                        seen.add(url)
+                    if len(held) > 0:
+                        queue.release(held, worker)
+
+                    try:
+                        outcome = self.run([(job['url'], job['chapters']) for job in jobs], filetype, bitrate, dpath,
+                                           **workers)
+                    except ValueError as e:
+                        outcome = [{'url': job['url'], 'status': 'failed', 'error': str(e)} for job in jobs]
+
+                    by_url = {result['url']: result for result in outcome}
+                    for job in jobs:
+                        result = by_url.get(job['url'], {'url': job['url'], 'status': 'failed',
+                                                         'error': 'no result reported'})
+                        queue.complete(job['id'], worker, result)
+                        results.append(result)
+            finally:
+                stopped.set()
+
+        return results
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def parse_jobs(jobs):
+        parsed = []
+        for job in jobs:
+            if type(job) == str:
+                job = {'url': job}
+            elif type(job) in (tuple, list):
+                job = dict(zip(('url', 'chapters'), job))
+
+            parsed.append((job['url'], Downloader.parse_chapters(job.get('chapters') or '')))
+
+        return parsed
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def parse_target(filetype, bitrate=''):
+        parsed = Downloader.parse_filetype(filetype), Downloader.parse_bitrate(bitrate)
+        if parsed[0] is None:
+            raise ValueError(f'Filetype .{filetype} not supported')
+        if parsed[1] is None:
+            raise ValueError(f'Invalid bitrate {bitrate}')
+
+        return parsed
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def parse_targets(filetype, bitrate=''):
+        # 'mp3:128,mp3:320,ogg' or [('mp3', '128'), 'ogg'], bitrate is the default for formats given without one
+        entries = filetype.split(',') if type(filetype) == str else filetype
+
+        targets = []
+        for entry in entries:
+            if type(entry) == str:
+                entry = entry.split(':', 1)
+            target = Downloader.parse_target(entry[0], entry[1] if len(entry) > 1 and entry[1] != '' else bitrate)
+            if target not in targets:
+                targets.append(target)
+
+        if len(targets) == 0:
+            raise ValueError('No output format given')
+
+        return targets
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def source_target(targets):
+        # The one stream that gets downloaded has to satisfy every target, so any video format asks for video and the
+        # highest bitrate wins
+        kind = 'video' if any(filetype[1] == 'video' for filetype, bitrate in targets) else 'audio'
+        filetype = next(filetype for filetype, bitrate in targets if filetype[1] == kind)
+        bitrates = [bitrate for filetype, bitrate in targets]
+        bitrate = '' if '' in bitrates else max(bitrates, key=lambda bitrate: float(bitrate[:-1]))
+
+        return filetype, bitrate
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def parse_chapters(chapters):
+        if type(chapters) != dict:
+            return ''
+
+        parsed = {}
+        for title, stamp in chapters.items():
+            if type(stamp) == str:
+                stamp = stamp.split(':')
+                if len(stamp) == 2:
+                    stamp = int(stamp[0]) * 60 + int(stamp[1])
+                else:
+                    stamp = int(stamp[0]) * 3600 + int(stamp[1]) * 60 + int(stamp[2])
+            parsed[title] = int(stamp)
+
+        return parsed
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def process(self, io_workers=None, cpu_workers=None, ffmpeg_threads=None):
+        cores = self.available_cores()
+        procspeed = self.options['fproc']
+
+        if procspeed != 0:
+            fetch_workers = transfer_workers = io_workers or cores * procspeed[0]
+            cpu_workers = cpu_workers or max(1, int(cores * procspeed[-1]))
+            ffmpeg_threads = ffmpeg_threads or 0
+        else:
+            # Network stages grow until throughput stops improving, io_workers caps how far they can go. Lookups are
+            # tiny requests, so they get room for hundreds in flight, downloads saturate the link much sooner
+            fetch_workers = AdaptiveLimit(io_workers or 256, start=min(io_workers or 256, 16))
+            maximum = io_workers or max(8, cores * 4)
+            transfer_workers = AdaptiveLimit(maximum, start=min(maximum, 2))
+            cpu_workers, ffmpeg_threads = self.cpu_budget(cores, self.filetype[1], cpu_workers, ffmpeg_threads)
+
+        # Every ffmpeg process takes one of the cpu_workers slots while it runs, whether it converts a whole file in
+        # the convert stage, streams one in the transfer stage or cuts a group of chapters. A video with chapters can
+        # then spread its groups over all the slots that other conversions leave free without oversubscribing the cores
+        split_workers = cpu_workers if self.options['spar'] == 1 else 1
+        slots = BoundedSemaphore(cpu_workers)
+        dpath = self.workspace['dpath']
+
+        if self.options['pipe'] == 1:
+            transfer = partial(self.stream_convert, targets=self.targets, dpath=dpath, archive=self.archive,
+                               threads=ffmpeg_threads, transport=self.transport, auto_split=self.options['ats'],
+                               slots=slots)
+        else:
+            transfer = partial(self.download, dpath=dpath, transport=self.transport)
+
+        fetch = partial(self.fetch_streams, filetype=self.filetype, options=self.options, bitrate=self.bitrate,
+                        cache=self.cache)
+        transfer = self.refresh_streams(transfer, fetch, self.cache)
+
+        pipeline = Pipeline([
+            (fetch, fetch_workers, 'fetch_streams'),
+            (transfer, transfer_workers, 'stream_convert' if self.options['pipe'] == 1 else 'download'),
+            (partial(self.convert, targets=self.targets, dpath=dpath, split_workers=split_workers,
+                     archive=self.archive, threads=ffmpeg_threads, auto_split=self.options['ats'], slots=slots),
+             cpu_workers, 'convert'),
+        ], tracer=self.tracer, classify=self.classify_error, retries=self.RETRIES, retry_delays=self.RETRY_DELAYS)
+
+        print('\nFetching, downloading and converting YouTube streams...\n')
+        self.skipped = []
+        started = perf_counter()
+        jobs = pipeline.run(self.pending_jobs())
+        self.tracer.record('transport', started, perf_counter(), **self.transport.metrics())
+        self.transport.print_metrics()
+
+        results = [job.summary() for job in jobs]
+        results += self.report_failures(self.expand_failures + pipeline.failures)
+        results += [{'url': url, 'status': 'skipped'} for url in self.skipped]
+
+        if self.tracer.enabled == 1:
+            self.tracer.write(self.workspace['trace'])
+            self.tracer.print_summary()
+            print(f'\nTrace written to {self.workspace["trace"]}.jsonl and {self.workspace["trace"]}.chrome.json')
+
+        return results
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def report_failures(failures):
+        if len(failures) > 0:
+            print('\n' + 'Failure report'.center(100, '-'))
+            for job, e, kind, attempts in sorted(failures, key=lambda failure: failure[2]):
+                print(f'{kind:<12}{attempts:>3} attempt{"s" if attempts > 1 else " "}  {job.url}  {type(e).__name__}: {e}')
+
+        return [dict(job.summary(), status='failed', error=f'{type(e).__name__}: {e}', error_class=kind,
+                     attempts=attempts)
+                for job, e, kind, attempts in failures]
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def classify_error(e):
+        if isinstance(e, FFmpegError):
+            return 'ffmpeg'
+        if isinstance(e, (youtube_exceptions.VideoUnavailable, youtube_exceptions.RegexMatchError)):
+            return 'unavailable'
+
+        status = Downloader.http_status(e)
+        if status in (429, 503):
+            return 'throttling'
+        elif status in (403, 404, 410):
+            return 'unavailable'
+        elif status is not None:
+            return 'transient' if status >= 500 else 'error'
+
+        if isinstance(e, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                          URLError, ConnectionError, TimeoutError, youtube_exceptions.MaxRetriesExceeded)):
+            return 'transient'
+
+        return 'error'
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def http_status(e):
+        if isinstance(e, HTTPError):
+            return e.code
+        elif isinstance(e, requests.HTTPError) and e.response is not None:
+            return e.response.status_code
+
+        return None
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def refresh_streams(transfer, fetch, cache=None):
+        # Signed stream URLs expire and are tied to the IP that asked for them, so a 403 usually means the stored one
+        # went stale. The streams are looked up again once before the error counts against the video
+        def run(job):
+            try:
+                return transfer(job)
+            except (HTTPError, requests.HTTPError) as e:
+                if Downloader.http_status(e) != 403:
+                    raise
+
+            print(f'\nWARNING stream URL for {job.file_name} was refused, looking it up again')
+            if cache is not None:
+                cache.delete('streams', job.video_id)
+
+            return transfer(fetch(job))
+
+        # ---------------------------------------------------------------------------------------------------------------
+
+        return run
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def available_cores():
+        if hasattr(os, 'sched_getaffinity'):
+            return len(os.sched_getaffinity(0))
+
+        return os.cpu_count() or 1
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def cpu_budget(cores, kind, jobs=None, threads=None):
+        # Audio encoders are effectively single threaded so every core gets its own ffmpeg, video encoders scale
+        # to a handful of threads so fewer, wider jobs keep the cores busy without oversubscribing them
+        if threads is None:
+            threads = 1 if kind == 'audio' else min(cores, 4)
+            if jobs is not None:
+                threads = max(threads, cores // max(1, jobs))
+
+        jobs = jobs or max(1, cores // threads)
+
+        return jobs, threads
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+        self.transport.close()
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def pending_jobs(self):
+        for url, ts in zip(self.urls, self.timestamps):
+            key = None
+
+            if self.archive is not None:
+                key = Archive.key(url, self.targets, self.options, ts)
+                if key in self.archive:
+                    print(f'{url} already processed')
+                    self.skipped.append(url)
+                    continue
+
+            yield Job(url, ts, key)
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def initialize_download_path(self):
+        if self.options['dp'] == 1:
+            self.workspace['dpath'] = os.path.abspath(self.workspace['dp'])
+
+        elif self.options['fdry'] == 1:
+            self.workspace['dpath'] = self.workspace['fdry']
+
+        else:
+            if getattr(sys, 'frozen', False):
+                download_path = os.path.dirname(sys.executable)
+            elif __file__:
+                download_path = os.path.dirname(os.path.abspath(__file__))
+            download_path = os.path.join(download_path, 'download')
+
+            if not os.path.exists(download_path):
+                os.makedirs(download_path)
+                print('\nCreated download directory')
+            else:
+                print('\nDownload directory found')
+
+            self.workspace['dpath'] = download_path
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def fetch_streams(job, filetype, options, bitrate='', cache=None):
+        feed, ts = job.url, job.chapters
+        metadata = Downloader.fetch_metadata(feed, cache, options['oauth'])
+        output = filetype
+        filetype = filetype[1]
+        timestamp_dict = ''
+
+        if options['dts'] == 1:
+            timestamp_dict = dict(metadata['chapters'])
+
+            if len(timestamp_dict) > 0:
+                titles = list(timestamp_dict.keys())
+                stamps = list(timestamp_dict.values())
+                length = metadata['length']
+
+                for idx, stamp in enumerate(stamps):
+                    if stamp == stamps[-1]:
+                        stamps[idx] = (stamp, length + 1)
+                    else:
+                        stamps[idx] = (stamp, stamps[idx + 1] + 1)
+
+                timestamp_dict = dict(zip(titles, stamps))
+
+            if len(timestamp_dict) == 0:
+                timestamp_dict = ''
+
+        elif type(ts) == dict and len(ts) > 0:
+            stamps = list(ts.values())
+            titles = list(ts.keys())
+            length = metadata['length']
+
+            for idx, stamp in enumerate(stamps):
+                if stamp == stamps[-1]:
+                    stamps[idx] = (stamp, length + 1)
+                else:
+                    stamps[idx] = (stamp, stamps[idx + 1] + 1)
+
+            timestamp_dict = dict(zip(titles, stamps))
+
+        file = Downloader.select_stream(metadata['streams'], output, bitrate)
+
+        job.video_id = metadata['id']
+        job.itag = file['itag']
+        job.stream_url = file['url']
+        job.file_name = file['default_filename']
+        job.timestamps = timestamp_dict
+        job.source = (Downloader.codec_name(file['video_codec']), Downloader.codec_name(file['audio_codec']),
+                      file['bitrate'] or 0)
+
+        print(f'Found {job.file_name}')
+
+        return job
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def fetch_metadata(feed, cache=None, oauth=0):
+        video_id = extract.video_id(feed)
+        info = cache.get('video', video_id) if cache is not None else None
+        streams = cache.get('streams', video_id) if cache is not None else None
+        if streams is not None and Downloader.streams_expire(streams) < time() + Downloader.STREAM_EXPIRY_MARGIN:
+            streams = None
+
+        if info is None or streams is None:
+            file = YouTube(feed, use_oauth=oauth == 1, allow_oauth_cache=True)
+
+            if info is None:
+                info = {
+                    'title': file.title,
+                    'length': file.length,
+                    'chapters': Downloader.description_timestamps(file.description or ''),
+                }
+                if cache is not None:
+                    cache.set('video', video_id, info)
+
+            if streams is None:
+                streams = [Downloader.stream_record(stream) for stream in file.streams]
+                if cache is not None:
+                    cache.set('streams', video_id, streams)
+
+        return dict(info, id=video_id, streams=streams)
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def oauth_token_cached():
+        return os.path.exists(innertube._token_file)
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def streams_expire(streams):
+        expires = []
+        for stream in streams:
+            try:
+                expires.append(int(parse_qs(urlparse(stream['url'] or '').query)['expire'][0]))
+            except (KeyError, ValueError):
+                pass
+
+        return min(expires) if len(expires) > 0 else float('inf')
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def playlist_urls(url, cache=None):
+        playlist = Playlist(url)
+        playlist_id = playlist.playlist_id
+
+        urls = cache.get('playlist', playlist_id) if cache is not None else None
+        if urls is None:
+            urls = list(playlist.video_urls)
+            if cache is not None:
+                cache.set('playlist', playlist_id, urls)
+
+        return urls
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def description_timestamps(description):
+        timestamp_dict = {}
+        for line in description.splitlines():
+            stamp = Downloader.parse_timestamp(line)
+            if stamp is not None:
+                timestamp_dict[stamp[0]] = stamp[1]
+
+        return timestamp_dict
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def stream_record(stream):
+        return {
+            'itag': stream.itag,
+            'url': stream.url,
+            'abr': stream.abr,
+            'resolution': stream.resolution,
+            'bitrate': stream.bitrate,
+            'audio_codec': stream.audio_codec,
+            'video_codec': stream.video_codec,
+            'only_audio': stream.includes_audio_track and not stream.includes_video_track,
+            'progressive': stream.is_progressive,
+            'default_filename': stream.default_filename,
+        }
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def codec_name(name):
+        name = (name or '').split('.')[0]
+        return {'mp4a': 'aac', 'avc1': 'h264', 'vp09': 'vp9', 'av01': 'av1', 'hev1': 'hevc'}.get(name, name) or None
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def select_stream(streams, filetype, bitrate):
+        def rate(stream):
+            if filetype[1] == 'audio':
+                return int((stream['abr'] or '0').replace('kbps', ''))
+            if target is None:
+                return int((stream['resolution'] or '0').replace('p', ''))
+            return (stream['bitrate'] or 0) / 1000
+
+        # ---------------------------------------------------------------------------------------------------------------
+
+        def fit(stream):
+            video_codecs, audio_codecs = Downloader.COPY_CODECS.get(filetype[0], (None, set()))
+            if Downloader.codec_name(stream['audio_codec']) not in audio_codecs:
+                return 0
+            if video_codecs is not None and Downloader.codec_name(stream['video_codec']) not in video_codecs:
+                return 0
+            return 1
+
+        # ---------------------------------------------------------------------------------------------------------------
+
+        target = float(bitrate[:-1]) if bitrate != '' else None
+
+        if filetype[1] == 'audio':
+            candidates = [stream for stream in streams if stream['only_audio']]
+        else:
+            candidates = [stream for stream in streams if stream['progressive']]
+
+        if len(candidates) == 0:
+            candidates = [stream for stream in streams if stream['audio_codec'] is not None]
+
+        if target is None:
+            return max(candidates, key=lambda stream: (rate(stream), fit(stream), stream['bitrate'] or 0))
+
+        sufficient = [stream for stream in candidates if rate(stream) >= target]
+        if len(sufficient) == 0:
+            return max(candidates, key=lambda stream: (rate(stream), fit(stream), stream['bitrate'] or 0))
+
+        return min(sufficient, key=lambda stream: (rate(stream), -fit(stream), stream['bitrate'] or 0))
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def download(job, dpath, segment_workers=4, transport=None):
+        file_name = job.file_name
+        path = os.path.join(dpath, file_name)
+
+        if not os.path.exists(path):
+            stats = RangedDownload(job.stream_url, path, workers=segment_workers, transport=transport).run()
+            job.filesize = stats['size']
+            print(f'\nDownloaded {file_name} ({stats["bytes"] / 1e6:.1f} MB at {stats["throughput"] / 1e6:.1f} MB/s)')
+        else:
+            job.filesize = os.path.getsize(path)
+            print(f'\n{file_name} already downloaded')
+
+        return job
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def stream_convert(job, targets, dpath, archive=None, chunk_size=4 * 1024 * 1024, threads=0, transport=None,
+                       auto_split=0, slots=None):
+        def feed(process):
+            streamed = 0
+            while True:
+                with transport.stream(job.stream_url,
+                                      headers={'Range': f'bytes={streamed}-{streamed + chunk_size - 1}'}) as r:
+                    r.raise_for_status()
+                    total = int(r.headers.get('Content-Range', '/0').split('/')[-1])
+
+                    received = 0
+                    for chunk in transport.iter_content(r):
+                        process.stdin.write(chunk)
+                        received += len(chunk)
+
+                streamed += received
+                if received == 0 or streamed >= total:
+                    return streamed
+
+        # ---------------------------------------------------------------------------------------------------------------
+
+        file_name = job.file_name
+        transport = transport or Transport()
+
+        # Chapter cuts seek around the source and silence detection reads it before converting, so both keep the
+        # temp file path
+        if type(job.timestamps) == dict or auto_split == 1:
+            return Downloader.download(job, dpath, transport=transport)
+
+        ext = file_name[file_name.find('.'):]
+        source = dict(zip(('video', 'audio', 'bit_rate'), job.source))
+        outputs = Downloader.target_outputs(source, targets)
+
+        args = []
+        for filetype, bitrate, codec, suffix in outputs:
+            args += Downloader.encode_args(filetype, bitrate, codec, threads).split()
+            args.append(os.path.join(dpath, file_name.replace(ext, f'{suffix}.{filetype}')))
+
+        start = perf_counter()
+        with slots or nullcontext():
+            process = subprocess.Popen(['ffmpeg', '-y', '-xerror', '-i', 'pipe:0'] + args, stdin=subprocess.PIPE)
+            streamed = 0
+            try:
+                streamed = feed(process)
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+            except Exception:
+                process.kill()
+                process.wait()
+                raise
+
+            status = process.wait()
+
+        if status != 0:
+            print(f'\nWARNING streaming conversion of {file_name} failed, falling back to a temporary file')
+            return Downloader.download(job, dpath, transport=transport)
+
+        if archive is not None and job.key is not None:
+            archive.add(job.key)
+
+        job.filesize = streamed
+        job.strategy = Downloader.strategy(outputs)
+        job.status = 0
+
+        seconds = perf_counter() - start
+        print(f'\n{file_name} Converted ({job.strategy}, streamed '
+              f'{streamed / 1e6:.1f} MB at {streamed / 1e6 / max(seconds, 1e-9):.1f} MB/s)')
+
+        return job
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def convert(job, targets, dpath, split_workers=1, archive=None, threads=0, auto_split=0, slots=None):
+        def ffmpeg(file_name, ext, timestamp, dpath):
+            source = os.path.join(dpath, file_name)
+            # Every target is another output of the same ffmpeg run, so the source is read and decoded only once
+            outputs = Downloader.target_outputs(Downloader.probe(source), targets)
+            replaced = []
+            kept = False
+            status = 0
+
+            if type(timestamp) == str:
+                args = ['ffmpeg', '-y', '-i', source]
+                for filetype, bitrate, codec, suffix in outputs:
+                    output = os.path.join(dpath, file_name.replace(ext, f'{suffix}.{filetype}'))
+                    if output == source:
+                        # A copy into the container the source is already in would be the same file, so the download
+                        # is kept as it is. ffmpeg cannot write over its own input, so a transcode to that name goes
+                        # to a temporary file that replaces the source afterwards
+                        if codec != '':
+                            kept = True
+                            continue
+                        output = os.path.join(dpath, file_name.replace(ext, f'{suffix}.part.{filetype}'))
+                        replaced.append(output)
+
+                    args += Downloader.encode_args(filetype, bitrate, codec, threads).split()
+                    args.append(output)
+
+                if len(args) > 4:
+                    with slots or nullcontext():
+                        status = subprocess.run(args).returncode
+                if status == 0:
+                    for output in replaced:
+                        os.replace(output, source)
+            elif type(timestamp) == dict:
+                dpath = os.path.join(dpath, file_name.replace(ext, ''))
+                status = max(Downloader.split_chapters(source, timestamp, outputs, dpath, split_workers, threads,
+                                                       slots))
+
+            # A failed conversion keeps its download so the retry or a look at the file does not need it again
+            if status == 0 and not kept and len(replaced) == 0:
+                os.remove(source)
+
+            return Downloader.strategy(outputs), status
+
+            #-----------------------------------------------------------------------------------------------------------
+
+        if job.strategy is not None:
+            return job
+
+        file_name = job.file_name
+
+        ext = file_name[file_name.find('.'):]
+
+        if auto_split == 1 and type(job.timestamps) == str:
+            try:
+                with slots or nullcontext():
+                    job.timestamps = SilenceDetector().chapters(os.path.join(dpath, file_name))
+                if type(job.timestamps) == dict:
+                    print(f'\nFound {len(job.timestamps)} tracks in {file_name}')
+            except ImportError:
+                print(f'\nWARNING numpy is not installed, converting {file_name} without splitting it')
+
+        job.strategy, job.status = ffmpeg(file_name, ext, job.timestamps, dpath)
+        if job.status != 0:
+            raise FFmpegError(f'ffmpeg exited with status {job.status} converting {file_name}')
+
+        if job.status == 0 and archive is not None and job.key is not None:
+            archive.add(job.key)
+
+        print(f'\n{file_name} Converted ({job.strategy})')
+
+        return job
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def probe(file_name):
+        try:
+            result = subprocess.run(['ffprobe', '-v', 'error', '-show_entries',
+                                     'stream=codec_type,codec_name,bit_rate:format=bit_rate', '-of', 'json', file_name],
+                                    capture_output=True, text=True)
+            info = json.loads(result.stdout)
+        except (OSError, ValueError):
+            return {}
+
+        streams = {}
+        for stream in info.get('streams', []):
+            streams.setdefault(stream.get('codec_type'), stream)
+
+        audio = streams.get('audio', {})
+        bit_rate = audio.get('bit_rate') if 'video' not in streams else None
+
+        return {
+            'video': streams.get('video', {}).get('codec_name'),
+            'audio': audio.get('codec_name'),
+            'bit_rate': int(bit_rate or info.get('format', {}).get('bit_rate') or 0),
+        }
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def codec_args(source, filetype, bitrate):
+        if source.get('audio') is None or filetype not in Downloader.COPY_CODECS:
+            return ''
+
+        video_codecs, audio_codecs = Downloader.COPY_CODECS[filetype]
+        if source['audio'] not in audio_codecs:
+            return ''
+        if video_codecs is not None and source['video'] not in video_codecs:
+            return ''
+
+        if bitrate != '' and not 0 < source['bit_rate'] <= float(bitrate[:-1]) * 1000:
+            return ''
+
+        return '-vn -c copy' if video_codecs is None else '-c copy'
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def target_outputs(source, targets):
+        # A format asked for at several bitrates gets the bitrate in its file names so the outputs stay apart
+        outputs = []
+        for filetype, bitrate in targets:
+            suffix = ''
+            if sum(1 for other, _ in targets if other[0] == filetype[0]) > 1:
+                suffix = f' {float(bitrate[:-1]):g}k' if bitrate != '' else ' max'
+            outputs.append((filetype[0], bitrate, Downloader.codec_args(source, filetype[0], bitrate), suffix))
+
+        return outputs
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def encode_args(filetype, bitrate, codec='', threads=0):
+        if codec != '':
+            return codec
+
+        args = '-vn ' if Downloader.parse_filetype(filetype)[1] == 'audio' else ''
+        if bitrate != '':
+            args += f'-b:v {bitrate} -b:a {bitrate} '
+        if threads > 0:
+            args += f'-threads {threads} '
+
+        return args.strip()
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def strategy(outputs):
+        copies = sum(1 for output in outputs if output[2] != '')
+        if copies == len(outputs):
+            return 'copy'
+
+        return 'transcode' if copies == 0 else 'copy+transcode'
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def split_chapters(file_name, timestamp, targets, dpath, workers=1, threads=0, slots=None):
+        def outputs(chapters, offset):
+            # Titles come from video descriptions, so they only ever reach ffmpeg as argv entries, never through a shell
+            args = []
+            for title, stamps in chapters:
+                title = title.replace('.', '').replace(':', '').replace(';', '').replace(',', '').replace('"', '')\
+                    .replace("'", "").replace('/', '').replace('\\', '')
+
+                for filetype, bitrate, codec, suffix in targets:
+                    args += ['-ss', str(stamps[0] - offset), '-to', str(stamps[1] - offset)]
+                    args += Downloader.encode_args(filetype, bitrate, codec, threads).split()
+                    args.append(os.path.join(dpath, title + f'{suffix}.{filetype}'))
+
+            return args
+
+        # ---------------------------------------------------------------------------------------------------------------
+
+        def ffmpeg(chapters):
+            if workers == 1 and not copy:
+                args = ['ffmpeg', '-y', '-i', file_name] + outputs(chapters, 0)
+            else:
+                # Input seeking jumps straight to the group's first chapter, so each process only decodes its own slice
+                offset = chapters[0][1][0]
+                args = ['ffmpeg', '-y', '-ss', str(offset), '-i', file_name] + outputs(chapters, offset)
+
+            with slots or nullcontext():
+                return subprocess.run(args).returncode
+
+        # ---------------------------------------------------------------------------------------------------------------
+
+        if not os.path.exists(dpath):
+            os.makedirs(dpath)
+
+        copy = all(target[2] != '' for target in targets)
+        chapters = sorted(timestamp.items(), key=lambda item: item[1][0])
+        workers = max(1, min(workers, len(chapters)))
+
+        if copy:
+            # Copy cuts do no decoding, so every chapter gets its own keyframe-aligned input seek
+            groups = [[chapter] for chapter in chapters]
+        elif workers == 1:
+            return [ffmpeg(chapters)]
+        else:
+            size = -(-len(chapters) // workers)
+            groups = [chapters[idx:idx + size] for idx in range(0, len(chapters), size)]
+
+        with ThreadPool(workers) as p:
+            return p.map(ffmpeg, groups)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class Tracer:
+    def __init__(self, enabled=1):
+        self.enabled = enabled
+        self.origin = perf_counter()
+        self.lock = Lock()
+        self.events = []
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def record(self, name, start, end, job=None, **fields):
+        if self.enabled == 0:
+            return
+
+        event = {
+            'stage': name,
+            'start': start - self.origin,
+            'duration': end - start,
+            'worker': current_thread().name,
+        }
+        if job is not None:
+            event['video'] = getattr(job, 'video_id', None) or getattr(job, 'url', None)
+            event['exit_code'] = getattr(job, 'status', None)
+        event.update(fields)
+
+        with self.lock:
+            self.events.append(event)
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @contextmanager
+    def span(self, name, **fields):
+        start = perf_counter()
+        try:
+            yield fields
+        finally:
+            self.record(name, start, perf_counter(), **fields)
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def summary(self):
+        def percentile(values, fraction):
+            return values[min(len(values) - 1, int(fraction * len(values)))]
+
+        # ---------------------------------------------------------------------------------------------------------------
+
+        stages = {}
+        for event in self.events:
+            stages.setdefault(event['stage'], []).append(event)
+
+        summary = {}
+        for name, events in stages.items():
+            durations = sorted(event['duration'] for event in events)
+            waits = sorted(event.get('queue_wait', 0) for event in events)
+            summary[name] = {
+                'count': len(events),
+                'errors': sum(1 for event in events if 'error' in event),
+                'bytes': sum(event.get('bytes') or 0 for event in events),
+                'total': sum(durations),
+                'p50': percentile(durations, .5),
+                'p90': percentile(durations, .9),
+                'p99': percentile(durations, .99),
+                'max': durations[-1],
+                'wait_p50': percentile(waits, .5),
+                'wait_p90': percentile(waits, .9),
+            }
+
+        return summary
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def print_summary(self):
+        print('\n' + 'Run summary'.center(100, '-'))
+        print(f'{"stage":<16}{"count":>7}{"errors":>8}{"MB":>9}{"p50 s":>9}{"p90 s":>9}{"p99 s":>9}{"max s":>9}'
+              f'{"wait p50":>10}{"wait p90":>10}')
+        for name, stage in self.summary().items():
+            print(f'{name:<16}{stage["count"]:>7}{stage["errors"]:>8}{stage["bytes"] / 1e6:>9.1f}{stage["p50"]:>9.2f}'
+                  f'{stage["p90"]:>9.2f}{stage["p99"]:>9.2f}{stage["max"]:>9.2f}{stage["wait_p50"]:>10.2f}'
+                  f'{stage["wait_p90"]:>10.2f}')
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def write(self, prefix):
+        with self.lock:
+            events = sorted(self.events, key=lambda event: event['start'])
+
+        with open(prefix + '.jsonl', 'w') as w:
+            for event in events:
+                w.write(json.dumps(event) + '\n')
+
+        trace_events = []
+        threads = {}
+        for event in events:
+            if event['worker'] not in threads:
+                threads[event['worker']] = len(threads) + 1
+                trace_events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(),
+                                     'tid': threads[event['worker']], 'args': {'name': event['worker']}})
+
+            args = {key: value for key, value in event.items() if key not in ('stage', 'start', 'duration', 'worker')}
+            trace_events.append({
+                'name': f'{event["stage"]} {event.get("video") or event.get("url") or ""}'.strip(),
+                'cat': event['stage'],
+                'ph': 'X',
+                'ts': event['start'] * 1e6,
+                'dur': event['duration'] * 1e6,
+                'pid': os.getpid(),
+                'tid': threads[event['worker']],
+                'args': args,
+            })
+
+        with open(prefix + '.chrome.json', 'w') as w:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, w)
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class AdaptiveLimit:
+    def __init__(self, maximum, minimum=1, start=None, window=None, error_rate=.2):
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.limit = min(self.maximum, max(self.minimum, start or 2))
+        self.window = window
+        self.error_rate = error_rate
+        self.condition = Condition()
+        self.active = 0
+        self.direction = 1
+        self.growing = True
+        self.previous = 0
+        self.history = [(perf_counter(), self.limit)]
+        self.reset()
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def reset(self):
+        self.started = perf_counter()
+        self.completed = 0
+        self.errors = 0
+        self.bytes = 0
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def acquire(self):
+        with self.condition:
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.active += 1
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def report(self, transferred=0, error=0):
+        with self.condition:
+            self.completed += 1
+            self.errors += error
+            self.bytes += transferred or 0
+            if self.completed < (self.window or max(4, self.limit)):
+                return
+
+            elapsed = max(perf_counter() - self.started, 1e-9)
+            rate = (self.bytes or self.completed - self.errors) / elapsed
+
+            # Errors back off multiplicatively. Otherwise the limit doubles until throughput first stops improving,
+            # then keeps stepping by one while it improves and turns around once it stops
+            if self.errors / self.completed > self.error_rate:
+                self.limit = max(self.minimum, self.limit // 2)
+                self.direction = 1
+                self.growing = False
+            elif self.growing and rate >= self.previous * 1.05:
+                self.limit = min(self.maximum, self.limit * 2)
+            else:
+                self.growing = False
+                if rate < self.previous * 1.05:
+                    self.direction = -self.direction
+                self.limit = min(self.maximum, max(self.minimum, self.limit + self.direction))
+
+            self.previous = rate
+            self.history.append((perf_counter(), self.limit))
+            self.reset()
+            self.condition.notify_all()
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class Pipeline:
+    def __init__(self, stages, queue_size=None, tracer=None, classify=None, retries=3, retry_delays=None):
+        self.stages = []
+        for idx, stage in enumerate(stages):
+            function, workers, name = stage if len(stage) == 3 else (stage[0], stage[1], f'stage{idx}')
+
+            # An adaptive stage starts a thread per allowed slot and lets the limit decide how many run at once
+            limit = workers if isinstance(workers, AdaptiveLimit) else None
+            self.stages.append((function, limit.maximum if limit is not None else workers, name, limit))
+        self.queue_size = queue_size
+        self.tracer = tracer or Tracer(enabled=0)
+        self.classify = classify
+        self.retries = retries
+        self.retry_delays = retry_delays or {}
+        self.failures = []
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    def run(self, jobs):
+        def worker(function, name, limit, inbox, outbox, remaining, next_workers):
+            while True:
+                if limit is not None:
+                    limit.acquire()
+                entry = inbox.get()
+                if entry is None:
+                    if limit is not None:
+                        limit.release()
+                    break
+
+                # Items carry the time they were queued, so queue_wait is how long this item sat in front of the stage
+                # rather than how long the worker sat idle before it arrived
+                enqueued, item = entry
+
+                size = getattr(item, 'filesize', None)
+                attempt = 0
+                failed = False
+                while True:
+                    start = perf_counter()
+                    try:
+                        result = function(item)
+                        break
+                    except Exception as e:
+                        kind = self.classify(e) if self.classify is not None else 'error'
+                        self.tracer.record(name, start, perf_counter(), item, queue_wait=start - enqueued,
+                                           error=f'{type(e).__name__}: {e}', error_class=kind, attempt=attempt + 1,
+                                           limit=limit.limit if limit is not None else None)
+                        # Only network trouble should shrink the window, a private or broken video is just a finished
+                        # item that says nothing about how much concurrency the link can take
+                        if limit is not None:
+                            limit.report(error=int(kind in self.retry_delays))
+
+                        # Only transient and throttling errors are worth another try, with exponential backoff and
+                        # jitter so retries from many workers do not land together
+                        if kind in self.retry_delays and attempt < self.retries:
+                            delay = self.backoff(self.retry_delays, kind, attempt)
+                            print(f'WARNING {kind} {type(e).__name__}: {e}, retrying in {delay:.1f} s')
+                            sleep(delay)
+                            attempt += 1
+                            enqueued = perf_counter()
+                            continue
+
+                        print(f'WARNING {kind} {type(e).__name__}: {e}')
+                        with lock:
+                            self.failures.append((item, e, kind, attempt + 1))
+                        failed = True
+                        break
+
+                if failed:
+                    if limit is not None:
+                        limit.release()
+                    continue
+
+                transferred = getattr(result, 'filesize', None) if size is None else None
+                self.tracer.record(name, start, perf_counter(), result or item, queue_wait=start - enqueued,
+                                   bytes=transferred, limit=limit.limit if limit is not None else None)
+                if limit is not None:
+                    limit.release()
+                    limit.report(transferred)
+
+                if result is not None:
+                    outbox.put((perf_counter(), result))
+
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    for _ in range(next_workers):
+                        outbox.put(None)
+
+        # ---------------------------------------------------------------------------------------------------------------
+
+        lock = Lock()
+        queues = [Queue(self.queue_size or workers * 2) for _, workers, _, _ in self.stages] + [Queue()]
+        threads = []
+
+        for idx, (function, workers, name, limit) in enumerate(self.stages):
+            next_workers = self.stages[idx + 1][1] if idx + 1 < len(self.stages) else 1
+            remaining = [workers]
+
+            for number in range(workers):
+                thread = Thread(target=worker, args=(function, name, limit, queues[idx], queues[idx + 1], remaining,
+                                                     next_workers), name=f'{name}-{number}', daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        for job in jobs:
+            queues[0].put((perf_counter(), job))
+        for _ in range(self.stages[0][1]):
+            queues[0].put(None)
+
+        for thread in threads:
+            thread.join()
+
+        results = []
+        while True:
+            entry = queues[-1].get()
+            if entry is None:
+                break
+            results.append(entry[1])
+
+        return results
+
+    # -----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def backoff(delays, kind, attempt):
+        return delays[kind] * 2 ** attempt * (1 + random() / 2)
+
+
+# =======================================================================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Download and convert YouTube videos and playlists without prompts',
+                                     epilog='exit codes: 0 every video converted, 1 some failed, 2 usage error, '
+                                            '3 ffmpeg missing, 4 state directory not writable')
+    parser.add_argument('urls', nargs='*', help='video or playlist URLs')
+    parser.add_argument('--url-file', help='text file with one video/playlist URL per line')
+    parser.add_argument('--timestamp-file', help='text file with URLs each followed by "mm:ss Title" chapter lines')
+    parser.add_argument('--job-file', help='JSON file with "jobs" ([url, {title: start}] or {"url", "chapters"}) '
+                                           'and any of the options below')
+    parser.add_argument('-f', '--format', help='output format: mp3, ogg, wav, mp4 or webm, or several from one download '
+                                               'and decode as FORMAT[:BITRATE],... e.g. mp3:128,mp3:320,ogg')
+    parser.add_argument('-b', '--bitrate', help='bitrate in kbps for formats given without one (default: max)')
+    parser.add_argument('-o', '--output', help='output directory (default: download next to the script)')
+    parser.add_argument('--dts', action='store_true', help='split videos by the timestamps in their descriptions')
+    parser.add_argument('--ats', action='store_true',
+                        help='split videos without timestamps into tracks at the silences between them')
+    parser.add_argument('--spar', action='store_true', help='split chapters across parallel ffmpeg processes')
+    parser.add_argument('--pipe', action='store_true', help='stream downloads straight into ffmpeg')
+    parser.add_argument('--no-cache', action='store_true', help='ignore the metadata cache')
+    parser.add_argument('--cache-ttl', metavar='KIND=AGE,...',
+                        help='how long cached video, playlist and streams entries stay valid, e.g. video=14d,playlist=6h '
+                             '(AGE in s, m, h or d; default: video=7d,playlist=1d,streams=5h)')
+    parser.add_argument('--cache-size', type=int, help='cache entries kept before the least recently used are evicted '
+                                                       '(default: 20000)')
+    parser.add_argument('--oauth', action='store_true',
+                        help='sign in with the OAuth token cached by an earlier interactive login (never prompts)')
+    parser.add_argument('--redo', action='store_true', help='ignore the download archive')
+    parser.add_argument('--io-workers', type=int, help='cap on concurrent fetches and downloads (default: adaptive)')
+    parser.add_argument('--cpu-workers', type=int, help='concurrent ffmpeg conversions (default: from the core count)')
+    parser.add_argument('--ffmpeg-threads', type=int, help='threads per ffmpeg conversion (default: from the format)')
+    parser.add_argument('--limit-rate', metavar='RATE', help='total download bandwidth in bytes/s, e.g. 500k or 5M')
+    parser.add_argument('--host-connections', type=int, help='concurrent download connections per host (default: 8)')
+    parser.add_argument('--fixed-workers', action='store_true',
+                        help='use fixed worker pools at twice the core count instead of adaptive sizing')
+    parser.add_argument('--queue', metavar='PATH|URL',
+                        help='work queue, a SQLite file on this host or the http://HOST:PORT of a --serve coordinator: '
+                             'given URLs are enqueued there for workers instead of being processed')
+    parser.add_argument('--serve', metavar='[HOST:]PORT',
+                        help='share the local --queue file with workers on other machines over HTTP until interrupted')
+    parser.add_argument('--worker', action='store_true', help='lease and process jobs from --queue until it is empty')
+    parser.add_argument('--worker-id', help='name recorded on leased jobs (default: host-pid)')
+    parser.add_argument('--batch', type=int, default=8, help='jobs a worker leases at a time')
+    parser.add_argument('--lease-timeout', type=float, default=900,
+                        help='seconds without a heartbeat before a leased job is handed to another worker')
+    parser.add_argument('--wait', action='store_true', help='after enqueuing, wait for the workers to drain the queue')
+    parser.add_argument('--report', help='write the per-video results to this JSON file')
+    parser.add_argument('--state-dir', help='directory for the metadata cache, download archive, ffmpeg location and '
+                                            'default trace (default: next to the script)')
+    parser.add_argument('--trace', metavar='PREFIX', help='write PREFIX.jsonl and PREFIX.chrome.json stage traces')
+    args = parser.parse_args(argv)
+
+    settings = {}
+    if args.job_file is not None:
+        with open(args.job_file, 'r') as r:
+            settings = json.load(r)
+
+    jobs = list(settings.get('jobs', [])) + args.urls
+    if args.url_file is not None:
+        jobs += Downloader.read_url_file(args.url_file)
+    if args.timestamp_file is not None:
+        jobs += Downloader.read_timestamp_file(args.timestamp_file)
+
+    filetype = args.format or settings.get('format')
+    remote = args.queue is not None and args.queue.startswith(('http://', 'https://'))
+    if args.worker and args.queue is None:
+        parser.error('--worker needs a --queue to work from')
+    if args.serve is not None and (args.queue is None or remote or args.worker):
+        parser.error('--serve needs a local --queue file and cannot run as a --worker')
+    if not args.worker and (args.serve is None or len(jobs) > 0) and (len(jobs) == 0 or filetype is None):
+        parser.error('at least one URL and an output --format are required')
+
+    options = {
+        'dts': int(args.dts or settings.get('dts', False)),
+        'ats': int(args.ats or settings.get('ats', False)),
+        'spar': int(args.spar or settings.get('spar', False)),
+        'pipe': int(args.pipe or settings.get('pipe', False)),
+        'ncache': int(args.no_cache or settings.get('no_cache', False)),
+        'redo': int(args.redo or settings.get('redo', False)),
+        'trace': int(args.trace is not None),
+        'fproc': (2, 1) if args.fixed_workers or settings.get('fixed_workers', False) else 0,
+        'oauth': int(args.oauth or settings.get('oauth', False)),
+    }
+
+    # pytube asks for the device login on stdin when it has no token, which would hang an unattended run
+    if options['oauth'] == 1 and not Downloader.oauth_token_cached():
+        parser.error('--oauth needs a token cached by an interactive login first, run the script without arguments')
+
+    ttl = args.cache_ttl or settings.get('cache_ttl')
+    try:
+        options['cache_ttl'] = MetadataCache.parse_ttl(ttl) if ttl is not None else 0
+    except ValueError:
+        parser.error(f'invalid --cache-ttl {ttl}')
+    options['cache_size'] = args.cache_size or settings.get('cache_size') or 0
+
+    rate = args.limit_rate or settings.get('limit_rate')
+    try:
+        rate = Transport.parse_rate(rate) if rate is not None else 0
+    except ValueError:
+        parser.error(f'invalid --limit-rate {rate}')
+    transport = Transport(rate=rate, per_host=args.host_connections or settings.get('host_connections') or 8)
+
+    workspace = {}
+    if args.trace is not None:
+        workspace['trace'] = args.trace
+    state = args.state_dir or settings.get('state_dir')
+    if state is not None:
+        workspace['state'] = os.path.abspath(state)
+
+    try:
+        downloader = Downloader(options, workspace=workspace, transport=transport)
+    except (OSError, sqlite3.Error) as e:
+        print(f'ERROR the metadata cache or download archive could not be opened ({type(e).__name__}: {e}), '
+              f'point --state-dir at a writable directory')
+        return 4
+    if downloader.runflag != 0:
+        print('ERROR ffmpeg was not found on PATH or in the ffmpeg folder next to the script')
+        return 3
+
+    bitrate = args.bitrate or settings.get('bitrate', '')
+    output = args.output or settings.get('output')
+    workers = {
+        'io_workers': args.io_workers or settings.get('io_workers'),
+        'cpu_workers': args.cpu_workers or settings.get('cpu_workers'),
+        'ffmpeg_threads': args.ffmpeg_threads or settings.get('ffmpeg_threads'),
+    }
+
+    try:
+        if args.queue is None:
+            results = downloader.run(jobs, filetype, bitrate, output, **workers)
+        else:
+            queue = RemoteQueue(args.queue, transport) if remote else WorkQueue(args.queue)
+            if args.worker:
+                results = downloader.work(queue, args.worker_id, output, args.batch, args.lease_timeout, **workers)
+            else:
+                results = []
+                if len(jobs) > 0:
+                    added = downloader.enqueue(queue, jobs, filetype, bitrate)
+                    print(f'\nQueued {added} new or failed jobs, queue now holds: '
+                          + ', '.join(f'{count} {status}' for status, count in sorted(queue.counts().items())))
+
+                    # Playlists that could not be expanded never reach the queue, so they are reported from here
+                    results = downloader.report_failures(downloader.expand_failures)
+
+                if args.serve is not None:
+                    host, _, port = args.serve.rpartition(':')
+                    server = QueueServer(queue, host or '0.0.0.0', int(port))
+                    print(f'\nServing {args.queue} on port {port}, start workers with '
+                          f'--queue http://{host or socket.gethostname()}:{port} --worker')
+                    try:
+                        server.serve()
+                    except KeyboardInterrupt:
+                        pass
+                elif args.wait:
+                    while queue.counts().get('queued', 0) + queue.counts().get('leased', 0) > 0:
+                        sleep(5)
+                    results += queue.results()
+            queue.close()
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        downloader.close()
+
+    if args.report is not None:
+        with open(args.report, 'w') as w:
+            json.dump(results, w, indent=2)
+
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    if len(results) > 0:
+        print('\nFinished: ' + ', '.join(f'{count} {status}' for status, count in sorted(counts.items())))
+
+    return 1 if counts.get('failed', 0) > 0 else 0
+
+
+# =======================================================================================================================
+
+if __name__ == '__main__':
+    freeze_support()
+
+    if len(sys.argv) > 1:
+        sys.exit(main())
+
+    downloader = Downloader()
+
+    if downloader.runflag == 0:
+        downloader.initialize_download_path()
+        downloader.process()
+        downloader.close()
 
         input('\nFinished... Press enter to complete the contract\n>> ')
         print('You now owe me a facet of your soul :)')
@@ -0,0 +1,127 @@
+import pytest
+
+from downloader_v3 import Downloader, MetadataCache, Options
+
+# =======================================================================================================================
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+# =======================================================================================================================
+
+@pytest.mark.parametrize('line, expected', [
+    ('00:00 Intro', ('Intro', 0)),
+    ('4:20 Name of Timestamp 2', ('Name of Timestamp 2', 260)),
+    ('1:02:03 Long one', ('Long one', 3723)),
+    ('[04:20] Bracketed', ('Bracketed', 260)),
+    ('(1:00) Parenthesised', ('Parenthesised', 60)),
+    ('Part 3 - 2:05   spaced    out ', ('spaced out', 125)),
+    ('12:34', ('', 754)),
+])
+def test_parse_timestamp(line, expected):
+    assert Downloader.parse_timestamp(line) == expected
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.parametrize('line', [
+    'Note: nothing to see here',
+    'Doors open at 10:30am',
+    'Shot in 16:9',
+    'https://example.com:8080/path',
+    '',
+])
+def test_parse_timestamp_ignores_other_colons(line):
+    assert Downloader.parse_timestamp(line) is None
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+def test_description_timestamps():
+    description = 'Tracklist:\n0:00 Start\nFilmed in 16:9\n[3:15] Middle part\n1:00:00 The end\n'
+
+    assert Downloader.description_timestamps(description) == {'Start': 0, 'Middle part': 195, 'The end': 3600}
+    assert Downloader.description_timestamps('') == {}
+
+# =======================================================================================================================
+
+def test_skip_template_drops_untouched_template():
+    lines = iter(Options.URL_TEMPLATE.splitlines(keepends=True) + ['https://youtu.be/dQw4w9WgXcQ\n'])
+
+    assert list(Downloader.skip_template(lines, Options.URL_TEMPLATE)) == ['https://youtu.be/dQw4w9WgXcQ\n']
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+def test_skip_template_keeps_edited_input():
+    lines = ['https://youtu.be/dQw4w9WgXcQ\n', 'https://youtu.be/FveF-we6lcE\n']
+
+    assert list(Downloader.skip_template(iter(lines), Options.TIMESTAMP_TEMPLATE)) == lines
+    assert list(Downloader.skip_template(iter([]), Options.URL_TEMPLATE)) == []
+
+# =======================================================================================================================
+
+def test_read_url_file(tmp_path):
+    path = write(tmp_path, 'url_inputs.txt', 'https://www.youtube.com/watch?v=dQw4w9WgXcQ\n\n   \n'
+                                             '  youtu.be/FveF-we6lcE  \nhttps://www.youtube.com/playlist?list=PL123\n')
+
+    assert list(Downloader.read_url_file(path)) == [
+        ('https://www.youtube.com/watch?v=dQw4w9WgXcQ', ''),
+        ('youtu.be/FveF-we6lcE', ''),
+        ('https://www.youtube.com/playlist?list=PL123', ''),
+    ]
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+def test_read_url_file_template_only(tmp_path):
+    path = write(tmp_path, 'url_inputs.txt', Options.URL_TEMPLATE)
+
+    assert list(Downloader.read_url_file(path)) == []
+
+# =======================================================================================================================
+
+def test_read_timestamp_file(tmp_path):
+    path = write(tmp_path, 'timestamp_inputs.txt',
+                 'https://www.youtube.com/watch?v=aaaaaaaaaaa\n'
+                 '00:00 Intro\n'
+                 'Note: not a chapter\n'
+                 '1:02:03 Late one\n'
+                 '\n'
+                 '[04:20] Bracketed\n'
+                 'https://youtu.be/bbbbbbbbbbb\n'
+                 'https://www.youtube.com/watch?v=ccccccccccc\n'
+                 '\n'
+                 '0:30 Only chapter\n')
+
+    assert list(Downloader.read_timestamp_file(path)) == [
+        ('https://www.youtube.com/watch?v=aaaaaaaaaaa', {'Intro': 0, 'Late one': 3723, 'Bracketed': 260}),
+        ('https://youtu.be/bbbbbbbbbbb', ''),
+        ('https://www.youtube.com/watch?v=ccccccccccc', {'Only chapter': 30}),
+    ]
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+def test_read_timestamp_file_ignores_lines_before_first_url(tmp_path):
+    path = write(tmp_path, 'timestamp_inputs.txt', '00:00 Orphan\nhttps://youtu.be/aaaaaaaaaaa\n00:10 Kept\n')
+
+    assert list(Downloader.read_timestamp_file(path)) == [('https://youtu.be/aaaaaaaaaaa', {'Kept': 10})]
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+def test_read_timestamp_file_template_only(tmp_path):
+    path = write(tmp_path, 'timestamp_inputs.txt', Options.TIMESTAMP_TEMPLATE)
+
+    assert list(Downloader.read_timestamp_file(path)) == []
+
+# =======================================================================================================================
+
+def test_parse_ttl():
+    assert MetadataCache.parse_ttl('video=14d, playlist=6h,streams=90') == {'video': 14 * 24 * 3600, 'playlist': 6 * 3600,
+                                                                           'streams': 90}
+    assert MetadataCache.parse_ttl({'streams': '30m'}) == {'streams': 1800}
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.parametrize('ttl', ['channel=1d', 'video', 'video=soon'])
+def test_parse_ttl_rejects_invalid(ttl):
+    with pytest.raises(ValueError):
+        MetadataCache.parse_ttl(ttl)
@@ -0,0 +1,135 @@
+import os
+import re
+import json
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+
+import pytest
+
+pytest.importorskip('requests')
+
+from downloader_v3 import RangedDownload, Transport
+
+# =======================================================================================================================
+
+SEGMENT = 64 * 1024
+DATA = bytes(idx % 251 for idx in range(5 * SEGMENT + 1000))
+
+class RangeServer:
+    def __init__(self, ranges=True):
+        self.ranges = ranges
+        self.lock = Lock()
+        self.served = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(handler):
+                handler.send_response(200)
+                handler.send_header('Content-Length', str(len(DATA)))
+                handler.end_headers()
+
+            def do_GET(handler):
+                match = re.match(r'bytes=(\d+)-(\d*)', handler.headers.get('Range', ''))
+                if match is None or not self.ranges:
+                    start, end = 0, len(DATA) - 1
+                    handler.send_response(200)
+                else:
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)) if match.group(2) else len(DATA) - 1, len(DATA) - 1)
+                    handler.send_response(206)
+                    handler.send_header('Content-Range', f'bytes {start}-{end}/{len(DATA)}')
+
+                handler.send_header('Content-Length', str(end - start + 1))
+                handler.end_headers()
+                handler.wfile.write(DATA[start:end + 1])
+                with self.lock:
+                    self.served.append((start, end))
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/source.m4a'
+
+    # -------------------------------------------------------------------------------------------------------------------
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def transport():
+    transport = Transport()
+    yield transport
+    transport.close()
+
+# =======================================================================================================================
+
+def test_resume_fetches_only_missing_segments(tmp_path, transport):
+    server = RangeServer()
+    file_name = str(tmp_path / 'video.m4a')
+    done = [0, 2, 3]
+
+    # A download that was interrupted with three of its six segments on disk
+    with open(file_name + '.part', 'wb') as w:
+        w.write(bytes(len(DATA)))
+        for idx in done:
+            w.seek(idx * SEGMENT)
+            w.write(DATA[idx * SEGMENT:(idx + 1) * SEGMENT])
+    with open(file_name + '.part.json', 'w') as w:
+        json.dump({'size': len(DATA), 'segment_size': SEGMENT, 'done': done}, w)
+
+    try:
+        stats = RangedDownload(server.url, file_name, segment_size=SEGMENT, workers=2, transport=transport).run()
+    finally:
+        server.close()
+
+    missing = len(DATA) - len(done) * SEGMENT
+    segments = sorted(served for served in server.served if served != (0, 0))
+
+    assert stats['bytes'] == missing
+    assert stats['size'] == len(DATA)
+    assert segments == [(SEGMENT, 2 * SEGMENT - 1), (4 * SEGMENT, 5 * SEGMENT - 1), (5 * SEGMENT, len(DATA) - 1)]
+    with open(file_name, 'rb') as r:
+        assert r.read() == DATA
+    assert not os.path.exists(file_name + '.part')
+    assert not os.path.exists(file_name + '.part.json')
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+def test_journal_for_another_size_starts_over(tmp_path, transport):
+    server = RangeServer()
+    file_name = str(tmp_path / 'video.m4a')
+    with open(file_name + '.part', 'wb') as w:
+        w.write(bytes(SEGMENT))
+    with open(file_name + '.part.json', 'w') as w:
+        json.dump({'size': SEGMENT, 'segment_size': SEGMENT, 'done': [0]}, w)
+
+    try:
+        stats = RangedDownload(server.url, file_name, segment_size=SEGMENT, transport=transport).run()
+    finally:
+        server.close()
+
+    assert stats['bytes'] == len(DATA)
+    with open(file_name, 'rb') as r:
+        assert r.read() == DATA
+    assert not os.path.exists(file_name + '.part.json')
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+def test_server_without_ranges_falls_back_to_one_stream(tmp_path, transport):
+    server = RangeServer(ranges=False)
+    file_name = str(tmp_path / 'video.m4a')
+
+    try:
+        stats = RangedDownload(server.url, file_name, segment_size=SEGMENT, transport=transport).run()
+    finally:
+        server.close()
+
+    assert stats['bytes'] == stats['size'] == len(DATA)
+    assert server.served == [(0, len(DATA) - 1)] * len(server.served)
+    with open(file_name, 'rb') as r:
+        assert r.read() == DATA
+    assert not os.path.exists(file_name + '.part')
@@ -0,0 +1,45 @@
+import pytest
+
+from downloader_v3 import Downloader
+
+# =======================================================================================================================
+
+WATCH = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+
+@pytest.mark.parametrize('url', [
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+    'https://m.youtube.com/watch?feature=share&v=dQw4w9WgXcQ&t=42',
+    'https://music.youtube.com/watch?v=dQw4w9WgXcQ',
+    'www.youtube.com/watch?v=dQw4w9WgXcQ',
+    'https://youtu.be/dQw4w9WgXcQ',
+    'youtu.be/dQw4w9WgXcQ?t=1',
+    'https://www.youtube.com/shorts/dQw4w9WgXcQ',
+    'https://www.youtube.com/embed/dQw4w9WgXcQ',
+    'https://www.youtube.com/live/dQw4w9WgXcQ?si=abc',
+    'https://www.youtube.com/v/dQw4w9WgXcQ',
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=PL123',
+    '  dQw4w9WgXcQ  ',
+])
+def test_canonical_url_video(url):
+    assert Downloader.canonical_url(url) == ('video', 'dQw4w9WgXcQ', WATCH)
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.parametrize('url, playlist_id', [
+    ('https://www.youtube.com/playlist?list=PLabc_-1', 'PLabc_-1'),
+    ('youtube.com/playlist?list=PLabc', 'PLabc'),
+    ('https://www.youtube.com/playlist?feature=share&list=OLAK5uy_x', 'OLAK5uy_x'),
+])
+def test_canonical_url_playlist(url, playlist_id):
+    assert Downloader.canonical_url(url) == ('playlist', playlist_id,
+                                             f'https://www.youtube.com/playlist?list={playlist_id}')
+
+# -----------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.parametrize('url, expected', [
+    ('https://example.com/video', 'https://example.com/video'),
+    ('example.com/video', 'https://example.com/video'),
+    ('https://www.youtube.com/watch?v=dQw4w9WgXcQX', 'https://www.youtube.com/watch?v=dQw4w9WgXcQX'),
+])
+def test_canonical_url_unknown(url, expected):
+    assert Downloader.canonical_url(url) == (None, None, expected)